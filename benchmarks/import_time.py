@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+#   Copyright 2015 Matvey Vyalkov
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+Benchmark for importing the stats module.
+Importing must be fast and must not touch the filesystem or the network.
+"""
+
+import os
+import sys
+import argparse
+import tempfile
+import subprocess
+
+SCRIPTDIR = os.path.abspath(os.path.dirname(__file__))
+ROOT = os.path.dirname(SCRIPTDIR)
+CODE = ("import time; start = time.perf_counter(); import stats; "
+        "print((time.perf_counter() - start) * 1000); "
+        "print(stats._translation is None and stats._opener is None)")
+
+
+def measure(runs):
+    """
+    Importing the module in fresh interpreters.
+    :param runs: number of runs
+    :return: list of times in milliseconds
+    """
+    times = []
+    env = dict(os.environ, PYTHONPATH=ROOT, PYTHONDONTWRITEBYTECODE="1")
+    for run in range(runs):
+        with tempfile.TemporaryDirectory(prefix="sysrq-") as cwd:
+            out = subprocess.check_output([sys.executable, "-c", CODE], cwd=cwd, env=env).decode("utf-8").split()
+            if os.listdir(cwd):
+                sys.exit("Importing created files: {}".format(os.listdir(cwd)))
+            if out[1] != "True":
+                sys.exit("Importing initialized locale or API session")
+            times.append(float(out[0]))
+    return times
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import-time benchmark for stats.py")
+    parser.add_argument("--runs", type=int, default=10, help="number of runs [10]")
+    parser.add_argument("--max-ms", type=float, default=150.0, help="fail if median time is bigger [150]")
+    args = parser.parse_args()
+
+    results = sorted(measure(args.runs))
+    median = results[len(results) // 2]
+    print("import stats: median {:.1f} ms, min {:.1f} ms, max {:.1f} ms".format(median, results[0], results[-1]))
+    if median > args.max_ms:
+        sys.exit("Too slow: {:.1f} ms > {:.1f} ms".format(median, args.max_ms))
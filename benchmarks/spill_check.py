@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+#   Copyright 2015 Matvey Vyalkov
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+Check for the memory limit of counting.
+Counts spilled to disk and merged must be the same as counts in memory.
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+from collections import Counter
+
+SCRIPTDIR = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.dirname(SCRIPTDIR))
+
+import stats
+
+
+def check(ids, spills, seed):
+    """
+    Counting random IDs with and without spilling.
+    :param ids: number of counted IDs
+    :param spills: approximate number of spills
+    :param seed: seed for random numbers
+    :return: True if counts are equal, number of spills and seconds of spilled counting
+    """
+    rng = random.Random(seed)
+    users = [rng.randrange(1, ids // 3) for i in range(ids)]
+    counter = stats.SpillingCounter(memory_limit=max(ids // spills, 1) * stats.SpillingCounter.entry_size)
+    start = time.perf_counter()
+    for offset in range(0, ids, 1000):
+        pack = users[offset:offset + 1000]
+        counter.update(pack[:500])
+        for uid in pack[500:]:
+            counter.add(uid, 1)
+    spilled = len(counter.spills)
+    result = list(counter.items())
+    seconds = time.perf_counter() - start
+    return result == sorted(Counter(users).items()), spilled, seconds
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Spilling check for stats.py")
+    parser.add_argument("--ids", type=int, default=300000, help="number of counted IDs [300000]")
+    parser.add_argument("--spills", type=int, default=50, help="approximate number of spills [50]")
+    parser.add_argument("--seed", type=int, default=0, help="seed for random numbers [0]")
+    args = parser.parse_args()
+
+    stats.init_locale()
+    equal, spilled, seconds = check(args.ids, args.spills, args.seed)
+    print("spilled counting: {} spills, {:.2f} s".format(spilled, seconds))
+    if not spilled:
+        sys.exit("Nothing was spilled, use less --spills or more --ids")
+    if not equal:
+        sys.exit("Spilled counts differ from counts in memory")
+    print("counts are equal")
@@ -35,27 +35,91 @@ import locale
 import time
 import urllib.error
 import socket
+import sqlite3
+import random
+import threading
+import itertools
+import heapq
+import bisect
+import mmap
+import calendar
+import math
+import base64
+import importlib.util
+from array import array
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue, Full
 from getpass import getpass
 from urllib import request
-from urllib.parse import urlencode
+from urllib.parse import urlencode, urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
 
 from libs.vk_api_auth.vk_auth import auth
 from libs.gettext_windows import gettext_windows
 
 console = True
+error = None
+success_win = None
 SCRIPTDIR = os.path.abspath(os.path.dirname(__file__))  # directory with this script
 HOME = os.path.expanduser("~")
 CURDIR = os.getcwd()
-if "results" not in os.listdir(CURDIR):
-    os.mkdir("{}/results".format(CURDIR))
 LOCALE_DIR = "{}/locale".format(SCRIPTDIR)
 APP = "vk_stats"
-# translating strings in _()
-lang = gettext_windows.get_language()
-locale.setlocale(locale.LC_ALL, "")
-locale.bindtextdomain(APP, LOCALE_DIR)
-translation = gettext.translation(APP, localedir=LOCALE_DIR, languages=lang)
-_ = translation.gettext
+
+# everything below is set up on the first use, so importing the module does no I/O
+_translation = None
+_opener = None
+
+
+def init_locale():
+    """
+    Setting up locale and translations (only once).
+    :return: gettext translation for the APP domain
+    """
+    global _translation
+    if _translation is None:
+        lang = gettext_windows.get_language()
+        try:
+            locale.setlocale(locale.LC_ALL, "")
+        except locale.Error:
+            pass
+        if not sys.platform.startswith("win"):
+            locale.bindtextdomain(APP, LOCALE_DIR)
+        _translation = gettext.translation(APP, localedir=LOCALE_DIR, languages=lang, fallback=True)
+    return _translation
+
+
+def _(message):
+    """
+    Translating strings.
+    :param message: original string
+    :return: translated string
+    """
+    return init_locale().gettext(message)
+
+
+def results_dir():
+    """
+    Directory for results, created on the first use.
+    :return: path to the directory
+    """
+    path = "{}/results".format(CURDIR)
+    if not os.path.isdir(path):
+        os.makedirs(path, exist_ok=True)
+    return path
+
+
+def api_opener():
+    """
+    URL opener shared by all API calls, created on the first use.
+    :return: urllib.request.OpenerDirector
+    """
+    global _opener
+    if _opener is None:
+        _opener = request.build_opener()
+    return _opener
 
 
 def parse_cmd_args():
@@ -68,17 +132,209 @@ def parse_cmd_args():
                         version="SysRq VK Stats v{}".format(__version__))
     parser.add_argument("--update", action="store_true",
                         help=_("check for updates"))
-    parser.add_argument("--mode", default="posts", choices=["posts", "likers", "liked"],
-                        help=_("specify a mode of stats [posts]"))
+    parser.add_argument("--mode", nargs="+", default=["posts"], choices=sorted(MODES),
+                        help=_("modes of stats, data for them is fetched once [posts]"))
+    parser.add_argument("--threads", type=int, default=4,
+                        help=_("number of threads for getting comments [4]"))
     parser.add_argument("--login", action="store_true",
                         help=_("get access to the VK"))
     parser.add_argument("--posts", type=int, default=0,
                         help=_("set a number of posts to scan [all]"))
     parser.add_argument("--date", default="0/0/0",
                         help=_("the earliest date of post in the yyyy/mm/dd format [0/0/0]"))
+    parser.add_argument("--export", nargs="+", default=list(DEFAULT_EXPORTS), choices=sorted(EXPORTERS) + ["all"],
+                        help=_("formats of results [txt csv]"))
+    parser.add_argument("--no-store", action="store_true",
+                        help=_("don't save crawled data for the \"query\" command"))
+    parser.add_argument("--memory-limit", type=parse_size, default=0,
+                        help=_("memory for counting, e.g. 512M; counts above it are spilled to disk [unlimited]"))
+    parser.add_argument("--approximate", action="store_true",
+                        help=_("approximate stats in fixed memory for posts, liked and likers modes"))
+    parser.add_argument("--sketch-size", type=int, default=1000,
+                        help=_("number of users counted in the approximate mode [1000]"))
+    parser.add_argument("--sample", type=parse_part, default=0,
+                        help=_("fetch only this part of pages, e.g. 0.05, and estimate counts for posts, liked and "
+                               "likers modes [off]"))
     return vars(parser.parse_args())
 
 
+def parse_query_args(argv):
+    """
+    Parsing command-line arguments for the "query" command.
+    :param argv: arguments after the command name
+    """
+    parser = argparse.ArgumentParser(prog="stats.py query",
+                                     description=_("Computing rating of activity from crawled data without VK."))
+    parser.add_argument("wall", help=_("screen name of the crawled wall"))
+    parser.add_argument("--mode", default="posts", choices=["posts", "likers", "liked"],
+                        help=_("specify a mode of stats [posts]"))
+    parser.add_argument("--date", default="0/0/0",
+                        help=_("the earliest date of post in the yyyy/mm/dd format [0/0/0]"))
+    parser.add_argument("--until", default="0/0/0",
+                        help=_("the latest date of post in the yyyy/mm/dd format [0/0/0]"))
+    parser.add_argument("--top", type=int, default=0,
+                        help=_("number of users in the rating [all]"))
+    parser.add_argument("--export", nargs="+", default=list(DEFAULT_EXPORTS), choices=sorted(EXPORTERS) + ["all"],
+                        help=_("formats of results [txt csv]"))
+    return vars(parser.parse_args(argv))
+
+
+def parse_timeline_args(argv):
+    """
+    Parsing command-line arguments for the "timeline" command.
+    :param argv: arguments after the command name
+    """
+    parser = argparse.ArgumentParser(prog="stats.py timeline",
+                                     description=_("Computing activity over time from crawled data without VK."))
+    parser.add_argument("wall", help=_("screen name of the crawled wall"))
+    parser.add_argument("--date", default="0/0/0",
+                        help=_("the earliest date of post in the yyyy/mm/dd format [0/0/0]"))
+    parser.add_argument("--until", default="0/0/0",
+                        help=_("the latest date of post in the yyyy/mm/dd format [0/0/0]"))
+    parser.add_argument("--tz", type=float, default=time.localtime().tm_gmtoff / 3600,
+                        help=_("offset of timezone in hours [local]"))
+    parser.add_argument("--top", type=int, default=0,
+                        help=_("number of users with own timelines [all]"))
+    parser.add_argument("--format", nargs="+", default=["csv", "json"], choices=["csv", "json"],
+                        help=_("formats of results [csv json]"))
+    return vars(parser.parse_args(argv))
+
+
+def parse_overlap_args(argv):
+    """
+    Parsing command-line arguments for the "overlap" command.
+    :param argv: arguments after the command name
+    """
+    parser = argparse.ArgumentParser(prog="stats.py overlap",
+                                     description=_("Computing overlap of audiences of crawled walls."))
+    parser.add_argument("walls", nargs="*", help=_("screen names of crawled walls [all crawled]"))
+    parser.add_argument("--audience", default="all", choices=["posters", "likers", "all"],
+                        help=_("active users to compare [all]"))
+    parser.add_argument("--date", default="0/0/0",
+                        help=_("the earliest date of post in the yyyy/mm/dd format [0/0/0]"))
+    parser.add_argument("--until", default="0/0/0",
+                        help=_("the latest date of post in the yyyy/mm/dd format [0/0/0]"))
+    return vars(parser.parse_args(argv))
+
+
+def parse_likes_args(argv):
+    """
+    Parsing command-line arguments for the "likes" command.
+    :param argv: arguments after the command name
+    """
+    parser = argparse.ArgumentParser(prog="stats.py likes", description=_("Drilling down into crawled likes."))
+    parser.add_argument("wall", help=_("screen name of the crawled wall"))
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--user", type=int, nargs="+",
+                        help=_("history of likes of a user, or posts liked by all given users"))
+    target.add_argument("--post", type=int, nargs="+",
+                        help=_("users who liked all given posts"))
+    return vars(parser.parse_args(argv))
+
+
+def parse_rings_args(argv):
+    """
+    Parsing command-line arguments for the "rings" command.
+    :param argv: arguments after the command name
+    """
+    parser = argparse.ArgumentParser(prog="stats.py rings",
+                                     description=_("Finding groups of accounts which like the same posts."))
+    parser.add_argument("wall", help=_("screen name of the crawled wall"))
+    parser.add_argument("--top", type=int, default=10000,
+                        help=_("number of the most active likers to compare [10000]"))
+    parser.add_argument("--min-common", type=int, default=10,
+                        help=_("minimal number of posts liked by both accounts [10]"))
+    parser.add_argument("--min-similarity", type=float, default=0.5,
+                        help=_("minimal Jaccard index of liked posts [0.5]"))
+    parser.add_argument("--max-likers", type=int, default=1000,
+                        help=_("skip posts liked by more of the compared accounts [1000]"))
+    return vars(parser.parse_args(argv))
+
+
+def parse_submit_args(argv):
+    """
+    Parsing command-line arguments for the "submit" command.
+    :param argv: arguments after the command name
+    """
+    parser = argparse.ArgumentParser(prog="stats.py submit", description=_("Adding crawl jobs for workers."))
+    parser.add_argument("walls", nargs="+", help=_("smth where the program will gather stats"))
+    parser.add_argument("--queue", default=None, help=_("path to the queue, a directory for many hosts "
+                                                           "[results/queue.sqlite]"))
+    parser.add_argument("--mode", nargs="+", default=["posts"], choices=sorted(MODES),
+                        help=_("modes of stats, data for them is fetched once [posts]"))
+    parser.add_argument("--threads", type=int, default=4,
+                        help=_("number of threads for getting comments [4]"))
+    parser.add_argument("--posts", type=int, default=0,
+                        help=_("set a number of posts to scan [all]"))
+    parser.add_argument("--date", default="0/0/0",
+                        help=_("the earliest date of post in the yyyy/mm/dd format [0/0/0]"))
+    parser.add_argument("--export", nargs="+", default=list(DEFAULT_EXPORTS), choices=sorted(EXPORTERS) + ["all"],
+                        help=_("formats of results [txt csv]"))
+    parser.add_argument("--no-store", action="store_true",
+                        help=_("don't save crawled data for the \"query\" command"))
+    parser.add_argument("--attempts", type=int, default=3,
+                        help=_("number of tries for every job [3]"))
+    return vars(parser.parse_args(argv))
+
+
+def parse_worker_args(argv):
+    """
+    Parsing command-line arguments for the "worker" command.
+    :param argv: arguments after the command name
+    """
+    parser = argparse.ArgumentParser(prog="stats.py worker", description=_("Running crawl jobs from the queue."))
+    parser.add_argument("--queue", default=None, help=_("path to the queue, a directory for many hosts "
+                                                           "[results/queue.sqlite]"))
+    parser.add_argument("--lease", type=float, default=300,
+                        help=_("seconds before a job of a silent worker is given to another one [300]"))
+    parser.add_argument("--poll", type=float, default=5,
+                        help=_("seconds between checks of the empty queue [5]"))
+    parser.add_argument("--once", action="store_true",
+                        help=_("exit when the queue is empty"))
+    return vars(parser.parse_args(argv))
+
+
+def parse_jobs_args(argv):
+    """
+    Parsing command-line arguments for the "jobs" command.
+    :param argv: arguments after the command name
+    """
+    parser = argparse.ArgumentParser(prog="stats.py jobs", description=_("Showing crawl jobs."))
+    parser.add_argument("--queue", default=None, help=_("path to the queue, a directory for many hosts "
+                                                           "[results/queue.sqlite]"))
+    return vars(parser.parse_args(argv))
+
+
+def parse_serve_args(argv):
+    """
+    Parsing command-line arguments for the "serve" command.
+    :param argv: arguments after the command name
+    """
+    parser = argparse.ArgumentParser(prog="stats.py serve", description=_("HTTP/JSON service with ratings."))
+    parser.add_argument("--host", default="127.0.0.1", help=_("address to listen [127.0.0.1]"))
+    parser.add_argument("--port", type=int, default=8080, help=_("port to listen [8080]"))
+    parser.add_argument("--ttl", type=float, default=3600,
+                        help=_("seconds before a rating is gathered again [3600]"))
+    parser.add_argument("--crawlers", type=int, default=2,
+                        help=_("number of crawls running at once [2]"))
+    parser.add_argument("--posts", type=int, default=0,
+                        help=_("set a number of posts to scan [all]"))
+    return vars(parser.parse_args(argv))
+
+
+def parse_merge_args(argv):
+    """
+    Parsing command-line arguments for the "merge" command.
+    :param argv: arguments after the command name
+    """
+    parser = argparse.ArgumentParser(prog="stats.py merge",
+                                     description=_("Merging sketches of the approximate mode."))
+    parser.add_argument("sketches", nargs="+", help=_("sketch_*.json files"))
+    parser.add_argument("--output", required=True, help=_("file for the merged sketch"))
+    parser.add_argument("--top", type=int, default=20, help=_("number of users to show [20]"))
+    return vars(parser.parse_args(argv))
+
+
 def no_console(error_func, success):
     """
     Preparing the program for GUI.
@@ -128,104 +384,2286 @@ def upgrade(version):
     exit()
 
 
-def upd_check():
+def upd_check():
+    """
+    Checking for updates
+    """
+    latest_file = request.urlopen(
+        "http://net2ftp.ru/node0/CyberTailor@gmail.com/versions.json").read().decode("utf-8")
+    latest = json.loads(latest_file)["vk_stats"]
+    if latest["number"] > v_number:
+        if console:
+            log_write(_("Found the update to version {}!\n\nChangelog:").format(latest["version"]))
+            print(request.urlopen(
+                "http://net2ftp.ru/node0/CyberTailor@gmail.com/vk_stats.CHANGELOG").read().decode("utf-8"))
+            choice = input(_("\nUpgrade? (Y/n)")).lower()
+            update_prompt = {"n": False, "not": False, "н": False, "нет": False}.get(choice, True)
+            if update_prompt:
+                upgrade(version=latest["version"])
+            else:
+                log_write(_("Passing the update...\n"))
+        else:
+            return latest["version"]
+    else:
+        if console:
+            log_write(_("You running the latest version\n"))
+
+
+def login():
+    """
+    Authorisation in https://vk.com
+    :return: access_token for VK
+    """
+    print(_("If you're afraid of losing the account, then:\n" +
+            "\t1) Go to http://vk.cc/3T1J9A\n" +
+            "\t2) Login and give permissions to app\n" +
+            "\t3) Copy part of an urlbar, which is containing the access_token\n" +
+            "\t4) Create a file 'token.txt' in home directory and write to one your access token"))
+    email = input(_("Your login: "))
+    password = getpass(_("Your password: "))
+    app_id = 4589594
+    token = auth(email, password, app_id, ["stats", "groups", "wall"])[0]
+    with open("{}/token.txt".format(HOME), mode="w") as token_file:
+        token_file.write(token)
+    return token
+
+
+class VKError(Exception):
+    """
+    Error returned by VK API or raised while calling it.
+    """
+
+    def __init__(self, code, message, *, method=None):
+        Exception.__init__(self, "VK API {}: {}".format(code, message))
+        self.code = code
+        self.message = message
+        self.method = method
+
+
+class RetryableError(VKError):
+    """
+    Transient error, the request can be repeated (network errors, internal server errors).
+    """
+
+
+class RateLimitError(RetryableError):
+    """
+    Too many requests, the request can be repeated after a pause.
+    """
+
+
+class AuthError(VKError):
+    """
+    Access token is invalid or the user must confirm something in a browser.
+    """
+
+
+class FatalError(VKError):
+    """
+    Error which will not disappear after repeating the request.
+    """
+
+
+class WallNotFoundError(ValueError):
+    """
+    Screen name doesn't belong to a user or a group.
+    """
+
+
+# codes from https://vk.com/dev/errors
+RATE_LIMIT_CODES = {6, 9, 29}
+RETRYABLE_CODES = {1, 10}  # 13 (runtime error in execute) repeats for the same code, so it is fatal
+AUTH_CODES = {5, 14, 17}
+
+
+def classify_error(error_data, *, method=None):
+    """
+    Making exception for an error from VK API.
+    :param error_data: "error" object from the response
+    :param method: method name
+    :return: instance of VKError subclass
+    """
+    code = error_data.get("error_code", 0)
+    message = error_data.get("error_msg", "")
+    if code in RATE_LIMIT_CODES:
+        cls = RateLimitError
+    elif code in RETRYABLE_CODES:
+        cls = RetryableError
+    elif code in AUTH_CODES:
+        cls = AuthError
+    else:
+        cls = FatalError
+    return cls(code, message, method=method)
+
+
+class CircuitBreaker:
+    """
+    Stopping requests to VK after many requests in a row got no answer, errors returned by VK mean it is alive.
+    Closed: requests are sent. Open: requests wait until reset_timeout is over.
+    Half-open: one request checks if VK is alive, success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, *, threshold=5, reset_timeout=30.0):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def wait_time(self):
+        """
+        Time before the next request is allowed.
+        :return: seconds, 0 if requests are allowed
+        """
+        with self._lock:
+            if self.opened_at is None:
+                return 0
+            left = self.opened_at + self.reset_timeout - time.monotonic()
+            if left <= 0:
+                self.opened_at = time.monotonic()  # half-open: let one probe through, hold the others
+                return 0
+            return left
+
+    def success(self):
+        """
+        Closing the circuit.
+        """
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def failure(self):
+        """
+        Counting a failure, opening the circuit if there are too many of them.
+        :return: True if the circuit is open
+        """
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+
+class RetryPolicy:
+    """
+    Repeating failed requests with capped exponential backoff and full jitter.
+    """
+
+    def __init__(self, *, max_tries=8, base_delay=0.5, max_delay=30.0, rate_limit_delay=1.0, breaker=None):
+        self.max_tries = max_tries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.rate_limit_delay = rate_limit_delay
+        self.breaker = breaker or CircuitBreaker()
+
+    def delay(self, attempt, err):
+        """
+        Pause before the next try.
+        :param attempt: number of the failed try, starting from 0
+        :param err: RetryableError
+        :return: seconds
+        """
+        backoff = min(self.max_delay, self.base_delay * 2 ** attempt)
+        if isinstance(err, RateLimitError):
+            return self.rate_limit_delay + random.uniform(0, backoff)
+        return random.uniform(0, backoff)
+
+    def call(self, func, *, method=None):
+        """
+        Calling function until it succeeds.
+        :param func: function without arguments, it raises VKError subclasses
+        :param method: method name for logging
+        :return: result of the function
+        """
+        attempt = 0
+        waiting = False
+        while True:
+            wait = self.breaker.wait_time()
+            if wait:
+                if not waiting:
+                    log_write(_("VK is unavailable. Waiting for {:.1f} seconds...").format(wait))
+                    waiting = True
+                time.sleep(min(wait, self.base_delay))  # a successful probe lets waiting requests go soon
+                continue
+            waiting = False
+            try:
+                result = func()
+            except RetryableError as err:
+                if err.code == 0:  # no answer from VK
+                    self.breaker.failure()
+                else:  # VK is alive even if it returned an error
+                    self.breaker.success()
+                attempt += 1
+                if attempt >= self.max_tries:
+                    raise
+                pause = self.delay(attempt - 1, err)
+                log_write(_("Error: {}. Waiting for {:.1f} seconds...").format(err, pause))
+                time.sleep(pause)
+            except VKError:
+                self.breaker.success()
+                raise
+            else:
+                self.breaker.success()
+                return result
+
+
+retry_policy = RetryPolicy()
+
+
+class RateLimiter:
+    """
+    Spacing requests from all threads, VK allows only 3 requests per second.
+    """
+
+    def __init__(self, interval=0.34):
+        self.interval = interval
+        self.next_time = 0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """
+        Waiting for a free slot.
+        """
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self.next_time)
+            self.next_time = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+rate_limiter = RateLimiter()
+
+
+def _request_api(method, req):
+    """
+    Sending one request to VK API.
+    :param method: method name
+    :param req: urllib.request.Request
+    :return: "response" object
+    """
+    rate_limiter.wait()
+    try:
+        result = json.loads(api_opener().open(req, timeout=5).read().decode("utf-8"))
+    except (urllib.error.URLError, socket.error, ValueError) as err:
+        raise RetryableError(0, str(err), method=method) from err
+    if "error" in result:
+        raise classify_error(result["error"], method=method)
+    return result["response"]
+
+
+def call_api(method, *, token, params, version=api_ver):
+    """
+    Calling VK API, it's safe to call it from several threads.
+    :param method: method name from https://vk.com/dev/methods
+    :param params: parameters for method (dict)
+    :param token: access_token
+    :param version: version of API
+    :return: result of calling API method
+    :raise VKError: if the request has failed (see RetryPolicy)
+    """
+    params.update({"access_token": token, "v": version})
+    data = urlencode(params)
+    headers = {"Content-length": str(len(data))}
+    url = "https://api.vk.com/method/" + method
+    req = request.Request(url, data=bytes(data, encoding="utf-8"), headers=headers)
+    return retry_policy.call(lambda: _request_api(method, req), method=method)
+
+
+def percents(el, seq):
+    """
+    Computing progress for sequence.
+    :param el: element
+    :param seq: sequence
+    :return: number of percents
+    """
+    return (seq.index(el) + 1) * 100 // len(seq)
+
+
+def ranking(data):
+    """
+    Sorting statistics, the most active users first.
+    :param data: list of (count, user) tuples
+    :return: iterator over (count, user) tuples
+    """
+    return iter(sorted(data, key=lambda sequence: sequence[0], reverse=True))
+
+
+class Sink:
+    """
+    Base class for exporting statistics to a file.
+    Rows are written to a temporary file which replaces the result only when everything is written.
+    """
+    extension = None
+    buffer_size = 1 << 16
+
+    def __init__(self, path, *, mode):
+        self.path = path
+        self.mode = mode
+        self.tmp_path = None
+        self.file = None
+
+    def open(self):
+        """
+        Opening a temporary file near the result.
+        """
+        fd, self.tmp_path = tempfile.mkstemp(prefix=".{}.".format(os.path.basename(self.path)),
+                                             dir=os.path.dirname(self.path))
+        self.file = open(fd, mode="w", encoding="utf-8", newline="", buffering=self.buffer_size)
+
+    def write(self, count, user):
+        """
+        Writing a row.
+        :param count: count for the user
+        :param user: user's information from users.get
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """
+        Closing the temporary file.
+        """
+        self.file.close()
+
+    def commit(self):
+        """
+        Replacing the result with the written file.
+        """
+        self.close()
+        os.chmod(self.tmp_path, 0o644)
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        """
+        Removing the written file.
+        """
+        try:
+            self.close()
+        finally:
+            os.remove(self.tmp_path)
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+
+class TxtSink(Sink):
+    """
+    Usual text file.
+    """
+    extension = "txt"
+
+    def open(self):
+        Sink.open(self)
+        print(_("STATISTICS FOR {}").format(self.mode.upper()), file=self.file)
+
+    def write(self, count, user):
+        print("https://vk.com/{screen_name} ({first_name} {last_name}): {0}".format(count, **user), file=self.file)
+
+
+class CsvSink(Sink):
+    """
+    Comma Separated Values.
+    """
+    extension = "csv"
+
+    def open(self):
+        Sink.open(self)
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(["URL", _("Name"), _("Count")])
+
+    def write(self, count, user):
+        self.writer.writerow(["https://vk.com/{screen_name}".format(**user),
+                              "{first_name} {last_name}".format(**user),
+                              count])
+
+
+class JsonlSink(Sink):
+    """
+    JSON object per line.
+    """
+    extension = "jsonl"
+
+    def open(self):
+        Sink.open(self)
+        self.rank = 0
+
+    def write(self, count, user):
+        self.rank += 1
+        row = {"rank": self.rank, "id": user["id"], "screen_name": user["screen_name"],
+               "first_name": user["first_name"], "last_name": user["last_name"], "count": count}
+        self.file.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+
+class SqliteSink(Sink):
+    """
+    SQLite database with the "stats" table.
+    """
+    extension = "sqlite"
+    batch_size = 10000
+
+    def open(self):
+        fd, self.tmp_path = tempfile.mkstemp(prefix=".{}.".format(os.path.basename(self.path)),
+                                             dir=os.path.dirname(self.path))
+        os.close(fd)
+        self.file = sqlite3.connect(self.tmp_path)
+        self.file.execute("PRAGMA journal_mode = OFF")
+        self.file.execute("PRAGMA synchronous = OFF")
+        self.file.execute("CREATE TABLE stats (rank INTEGER PRIMARY KEY, id INTEGER, screen_name TEXT, "
+                          "first_name TEXT, last_name TEXT, count INTEGER)")
+        self.rows = []
+        self.rank = 0
+
+    def _flush(self):
+        self.file.executemany("INSERT INTO stats VALUES (?, ?, ?, ?, ?, ?)", self.rows)
+        self.rows = []
+
+    def write(self, count, user):
+        self.rank += 1
+        self.rows.append((self.rank, user["id"], user["screen_name"], user["first_name"], user["last_name"], count))
+        if len(self.rows) >= self.batch_size:
+            self._flush()
+
+    def commit(self):
+        self._flush()
+        self.file.execute("CREATE INDEX stats_id ON stats (id)")
+        self.file.execute("CREATE INDEX stats_name ON stats (last_name, first_name)")  # for sorting in viewers
+        self.file.execute("CREATE INDEX stats_screen_name ON stats (screen_name)")
+        self.file.commit()
+        Sink.commit(self)
+
+
+EXPORTERS = {sink.extension: sink for sink in (TxtSink, CsvSink, JsonlSink, SqliteSink)}
+DEFAULT_EXPORTS = ("txt", "csv")
+
+
+def export(rows, *, mode, name, exports=DEFAULT_EXPORTS):
+    """
+    Exporting rows to all chosen sinks at once.
+    :param rows: iterator over (count, user) tuples
+    :param mode: prefix for files
+    :param name: screen name of the wall
+    :param exports: extensions from EXPORTERS
+    :return: list of paths
+    """
+    res_dir = results_dir()
+    sinks = [EXPORTERS[ext]("{}/{}_{}.{}".format(res_dir, mode, name, ext), mode=mode) for ext in exports]
+    opened = []
+    try:
+        for sink in sinks:
+            sink.open()
+            opened.append(sink)
+        for count, user in rows:
+            for sink in sinks:
+                sink.write(count, user)
+    except BaseException:
+        for sink in opened:
+            sink.abort()
+        raise
+    for sink in sinks:
+        sink.commit()
+        log_write(_("Exported to: {}").format(sink.path))
+    return [sink.path for sink in sinks]
+
+
+class RatingPages:
+    """
+    Pages of a rating exported to the sqlite format, for viewers of big ratings.
+    Sorting, searching and paging are done by SQLite, only the requested page is read.
+    """
+    orders = {"rank": ("rank",), "count": ("rank",), "id": ("id",), "name": ("last_name", "first_name", "rank"),
+              "screen_name": ("screen_name", "rank")}  # ranks are ordered by counts already
+
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.create_function("casefold", 1, lambda text: (text or "").casefold())
+        self._totals = {}
+
+    @staticmethod
+    def _where(search):
+        if not search:
+            return "", []
+        text = "screen_name || ' ' || first_name || ' ' || last_name || ' ' || first_name"
+        if max(search) < "\x80":  # LIKE is faster, but ignores case only for ASCII
+            where = "WHERE {} LIKE ?1 ESCAPE '\\'".format(text)
+            pattern = "%{}%".format(search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_"))
+        else:
+            where = "WHERE instr(casefold({}), ?1)".format(text)
+            pattern = search.casefold()
+        if search.isdigit():
+            return where + " OR id = ?2", [pattern, int(search)]
+        return where, [pattern]
+
+    def total(self, search=""):
+        """
+        Number of rows.
+        :param search: part of a name or screen name, or ID
+        :return: number of found rows
+        """
+        if search not in self._totals:
+            where, params = self._where(search)
+            self._totals[search] = self.db.execute("SELECT COUNT(*) FROM stats {}".format(where), params).fetchone()[0]
+        return self._totals[search]
+
+    def page(self, offset=0, limit=100, *, order="rank", descending=False, search=""):
+        """
+        Reading a page of rows.
+        :param offset: number of skipped rows
+        :param limit: number of rows
+        :param order: key from orders
+        :param descending: reverse order
+        :param search: part of a name or screen name, or ID
+        :return: list of (rank, ID, screen name, first name, last name, count) tuples
+        """
+        if order == "count":
+            descending = not descending
+        direction = " DESC" if descending else ""
+        columns = ", ".join(column + direction for column in self.orders[order])
+        where, params = self._where(search)
+        return self.db.execute("SELECT rank, id, screen_name, first_name, last_name, count FROM stats {} "
+                               "ORDER BY {} LIMIT ? OFFSET ?".format(where, columns),
+                               params + [limit, offset]).fetchall()
+
+    def close(self):
+        """
+        Closing the rating.
+        """
+        self.db.close()
+
+
+# VKScript for the "execute" method: likers of up to 25 posts, a list for every post
+LIKES_CODE = ("var posts = [{posts}]; var result = []; var i = 0; "
+              "while (i < posts.length) {{ "
+              "result.push(API.likes.getList({{\"type\": \"post\", \"owner_id\": {wall}, "
+              "\"item_id\": posts[i], \"count\": 1000}}).items); i = i + 1; }} "
+              "return result;")
+
+
+# VKScript for the "execute" method: only needed fields of posts as parallel arrays, up to 25 pages of 100 posts
+SLIM_POSTS_CODE = ("var result = {{\"id\": [], \"from_id\": [], \"date\": [], \"likes\": [], \"comments\": [], "
+                   "\"reposts\": []}}; "
+                   "var i = 0; "
+                   "while (i < {pages}) {{ "
+                   "var r = API.wall.get({{\"owner_id\": {wall}, \"offset\": {offset} + i * 100, \"count\": 100, "
+                   "\"filter\": \"{filter}\"}}).items; "
+                   "result.id = result.id + r@.id; result.from_id = result.from_id + r@.from_id; "
+                   "result.date = result.date + r@.date; result.likes = result.likes + r@.likes; "
+                   "result.comments = result.comments + r@.comments; result.reposts = result.reposts + r@.reposts; "
+                   "i = i + 1; }} "
+                   "return result;")
+# VKScript for the "execute" method: needed fields of posts from pages at given offsets, up to 25 pages
+SAMPLE_POSTS_CODE = ("var offsets = [{offsets}]; var result = []; var i = 0; "
+                     "while (i < offsets.length) {{ "
+                     "var r = API.wall.get({{\"owner_id\": {wall}, \"offset\": offsets[i], \"count\": 100, "
+                     "\"filter\": \"{filter}\"}}).items; "
+                     "result.push({{\"id\": r@.id, \"from_id\": r@.from_id, \"date\": r@.date, "
+                     "\"likes\": r@.likes}}); i = i + 1; }} "
+                     "return result;")
+# VKScript for the "execute" method: pages of comments, [post ID, offset] for every task
+COMMENTS_CODE = ("var tasks = [{tasks}]; var result = []; var i = 0; "
+                 "while (i < tasks.length) {{ "
+                 "var r = API.wall.getComments({{\"owner_id\": {wall}, \"post_id\": tasks[i][0], "
+                 "\"offset\": tasks[i][1], \"count\": 100, \"thread_items_count\": 10}}); "
+                 "result.push({{\"count\": r.current_level_count, \"from\": r.items@.from_id, "
+                 "\"ids\": r.items@.id, \"threads\": r.items@.thread}}); i = i + 1; }} "
+                 "return result;")
+# pages of replies, [post ID, comment ID, offset] for every task
+REPLIES_CODE = ("var tasks = [{tasks}]; var result = []; var i = 0; "
+                "while (i < tasks.length) {{ "
+                "var r = API.wall.getComments({{\"owner_id\": {wall}, \"post_id\": tasks[i][0], "
+                "\"comment_id\": tasks[i][1], \"offset\": tasks[i][2], \"count\": 100}}); "
+                "result.push({{\"from\": r.items@.from_id}}); i = i + 1; }} "
+                "return result;")
+# threads of comments appeared in this version
+COMMENTS_API_VER = "5.101"
+
+
+def parse_date(date):
+    """
+    Converting date to timestamp.
+    :param date: date in the yyyy/mm/dd format, 0/0/0 is no date
+    :return: timestamp or None
+    """
+    date_list = date.split("/")
+    if not len(date_list) == 3 or not all(part.isdigit() for part in date_list):
+        raise ValueError(_("Incorrect date!"))
+    if not int("".join(date_list)):
+        return None
+    return time.mktime((int(date_list[0]), int(date_list[1]), int(date_list[2]), 0, 0, 0, 0, 0, 0))
+
+
+def write_atomic(path, write, *, binary=False):
+    """
+    Writing a file which is replaced only when everything is written.
+    :param path: path to the file
+    :param write: function which gets the opened text file
+    :param binary: open a binary file instead
+    """
+    fd, tmp_path = tempfile.mkstemp(prefix=".{}.".format(os.path.basename(path)), dir=os.path.dirname(path))
+    try:
+        if binary:
+            file = open(fd, mode="wb", buffering=Sink.buffer_size)
+        else:
+            file = open(fd, mode="w", encoding="utf-8", newline="", buffering=Sink.buffer_size)
+        with file:
+            write(file)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+WEEKDAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+
+
+def bin_dates(dates, *, offset=0, weights=None):
+    """
+    Counting activity by hours of week and days in one pass.
+    :param dates: sequence of timestamps
+    :param offset: offset of timezone in seconds
+    :param weights: sequence of weights for every date, 1 by default
+    :return: list of 168 counts (Monday 0:00 first) and collections.Counter {day number: count}
+    """
+    # 1970/01/01 was Thursday, so hours since epoch are shifted by 3 days to start weeks from Monday
+    hours = [(ts + offset) // 3600 for ts in dates]
+    week = [0] * 168
+    days = Counter()
+    if weights is None:
+        for hour, count in Counter(hours).items():
+            week[(hour + 72) % 168] += count
+            days[hour // 24] += count
+    else:
+        by_hour = Counter()
+        for hour, weight in zip(hours, weights):
+            by_hour[hour] += weight
+        for hour, count in by_hour.items():
+            week[(hour + 72) % 168] += count
+            days[hour // 24] += count
+    return week, days
+
+
+def day_name(day):
+    """
+    Date for a day number.
+    :param day: days since 1970/01/01
+    :return: date in the yyyy-mm-dd format
+    """
+    return time.strftime("%Y-%m-%d", time.gmtime(day * 86400))
+
+
+def activity_summary(week, days):
+    """
+    Making JSON-compatible summary of activity.
+    :param week: counts by hours of week (see bin_dates)
+    :param days: counts by days (see bin_dates)
+    :return: dictionary with hours, weekdays, heatmap and days
+    """
+    heatmap = [week[day * 24:day * 24 + 24] for day in range(7)]
+    return {"hours": [sum(row[hour] for row in heatmap) for hour in range(24)],
+            "weekdays": dict(zip(WEEKDAYS, (sum(row) for row in heatmap))),
+            "heatmap": dict(zip(WEEKDAYS, heatmap)),
+            "days": {day_name(day): days[day] for day in sorted(days)}}
+
+
+def local_day(timestamp):
+    """
+    Local calendar day of a timestamp.
+    :param timestamp: timestamp
+    :return: days since 1970/01/01 (see day_name)
+    """
+    return calendar.timegm(time.localtime(timestamp)) // 86400
+
+
+class DailyIndex:
+    """
+    Counts of users by days with prefix sums, so a rating for any range of days is counted without posts.
+    """
+
+    def __init__(self, rows):
+        """
+        :param rows: iterable of (user ID, day, count) tuples sorted by users and days
+        """
+        self.users = array("q")
+        self.starts = array("q")  # start of days of every user in "days" and "sums", and the end
+        self.days = array("q")
+        self.sums = array("q")  # count of the user up to the day, including it
+        last = None
+        total = 0
+        for uid, day, count in rows:
+            if uid != last:
+                self.users.append(uid)
+                self.starts.append(len(self.days))
+                last = uid
+                total = 0
+            total += count
+            self.days.append(day)
+            self.sums.append(total)
+        self.starts.append(len(self.days))
+
+    def counts(self, first=None, last=None, *, exclude=None):
+        """
+        Counting activity of users for a range of days.
+        :param first: the first day, None is the earliest
+        :param last: the last day, None is the latest
+        :param exclude: ID of a user to skip, e.g. the owner of the wall
+        :return: list of (user ID, count) tuples, the most active users first
+        """
+        days = self.days
+        sums = self.sums
+        starts = self.starts
+        result = []
+        for index, uid in enumerate(self.users):
+            start = starts[index]
+            end = starts[index + 1]
+            low = start if first is None else bisect.bisect_left(days, first, start, end)
+            high = end if last is None else bisect.bisect_right(days, last, start, end)
+            if high > low and uid != exclude:
+                result.append((uid, sums[high - 1] - (sums[low - 1] if low > start else 0)))
+        result.sort(key=lambda pair: pair[1], reverse=True)
+        return result
+
+
+def popcount(number):
+    """
+    Number of set bits.
+    :param number: non-negative integer
+    :return: count of bits
+    """
+    return number.bit_count() if hasattr(number, "bit_count") else bin(number).count("1")
+
+
+class AudienceOverlap:
+    """
+    Overlap of active audiences of walls.
+    Audiences are sorted arrays of IDs which are merged once: every user of several walls gets a position, and
+    every audience becomes a bitmap (Python integer) over these users only, so one bitwise AND gives
+    an intersection of two walls. Users of one wall are only counted in its size, so memory is proportional to
+    the audiences, not to the number of all users multiplied by the number of walls.
+    """
+
+    def __init__(self):
+        self.names = []
+        self.sizes = []
+        self.bitmaps = []
+        self._arrays = []
+
+    def add(self, name, ids):
+        """
+        Adding audience of a wall.
+        :param name: name of the wall
+        :param ids: sorted array of unique users' IDs
+        """
+        self.names.append(name)
+        self.sizes.append(len(ids))
+        self._arrays.append(ids)
+
+    def build(self):
+        """
+        Converting added audiences to bitmaps.
+        :return: number of all users
+        """
+        positions = [array("q") for ids in self._arrays]  # positions of shared users of every wall
+        merged = heapq.merge(*(zip(ids, itertools.repeat(number)) for number, ids in enumerate(self._arrays)))
+        users = 0
+        shared = 0
+        for uid, group in itertools.groupby(merged, key=lambda pair: pair[0]):
+            users += 1
+            walls = [number for uid, number in group]
+            if len(walls) > 1:
+                for number in walls:
+                    positions[number].append(shared)
+                shared += 1
+        self._arrays = []
+        masks = [1 << bit for bit in range(8)]
+        for wall_positions in positions:
+            bits = bytearray((shared + 7) // 8)
+            for position in wall_positions:
+                bits[position >> 3] |= masks[position & 7]
+            self.bitmaps.append(int.from_bytes(bytes(bits), "little"))
+        return users
+
+    def matrices(self):
+        """
+        Pairwise intersections and Jaccard indexes.
+        :return: intersection matrix and Jaccard matrix (lists of lists)
+        """
+        sizes = self.sizes
+        count = len(self.bitmaps)
+        inter = [[0] * count for i in range(count)]
+        jaccard = [[0.0] * count for i in range(count)]
+        for i in range(count):
+            inter[i][i] = sizes[i]
+            jaccard[i][i] = 1.0 if sizes[i] else 0.0
+            for j in range(i + 1, count):
+                common = popcount(self.bitmaps[i] & self.bitmaps[j])
+                union = sizes[i] + sizes[j] - common
+                inter[i][j] = inter[j][i] = common
+                jaccard[i][j] = jaccard[j][i] = round(common / union, 6) if union else 0.0
+        return inter, jaccard
+
+
+class LikeIndex:
+    """
+    Index of likes in both directions: likers of every post and posts liked by every user.
+    It is saved as sorted arrays of 64-bit integers (compressed sparse rows) and read through mmap, so opening
+    it doesn't load likes into memory.
+    """
+    magic = b"SYSRQLI1"
+    sections = ("posts", "dates", "post_starts", "likers", "users", "user_starts", "liked")
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        header = 8 * (len(self.sections) + 1)
+        if self._map[:8] != self.magic:
+            self.close()
+            raise ValueError(_("Not an index of likes: {}").format(path))
+        self._views = []
+        offset = header
+        for name, size in zip(self.sections, array("q", self._map[8:header])):
+            view = memoryview(self._map)[offset:offset + size * 8].cast("q")
+            self._views.append(view)
+            setattr(self, name, view)
+            offset += size * 8
+
+    @classmethod
+    def build(cls, store, path):
+        """
+        Making the index from crawled likes.
+        :param store: CrawlStore
+        :param path: path to the index file
+        :return: number of likes
+        """
+        arrays = {name: array("q") for name in cls.sections}
+        for key, value, starts, items, query in (
+                ("posts", "likers", "post_starts", "likers",
+                 "SELECT post_id, user_id FROM likes ORDER BY post_id, user_id"),
+                ("users", "liked", "user_starts", "liked",
+                 "SELECT user_id, post_id FROM likes ORDER BY user_id, post_id")):
+            keys = arrays[key]
+            for first, second in store.db.execute(query):
+                if not keys or keys[-1] != first:
+                    keys.append(first)
+                    arrays[starts].append(len(arrays[items]))
+                arrays[items].append(second)
+            arrays[starts].append(len(arrays[items]))
+        dates = dict(store.db.execute("SELECT id, date FROM posts WHERE id IN (SELECT DISTINCT post_id FROM likes)"))
+        arrays["dates"].extend(dates.get(post, 0) for post in arrays["posts"])
+
+        def write(file):
+            file.write(cls.magic)
+            array("q", (len(arrays[name]) for name in cls.sections)).tofile(file)
+            for name in cls.sections:
+                arrays[name].tofile(file)
+        write_atomic(path, write, binary=True)
+        return len(arrays["likers"])
+
+    @staticmethod
+    def _find(keys, key):
+        index = bisect.bisect_left(keys, key)
+        return index if index < len(keys) and keys[index] == key else None
+
+    def likers_of(self, post):
+        """
+        Users who liked a post.
+        :param post: ID of the post
+        :return: sorted list of users' IDs
+        """
+        index = self._find(self.posts, post)
+        if index is None:
+            return []
+        return self.likers[self.post_starts[index]:self.post_starts[index + 1]].tolist()
+
+    def liked_by(self, user):
+        """
+        Posts liked by a user.
+        :param user: ID of the user
+        :return: sorted list of posts' IDs
+        """
+        index = self._find(self.users, user)
+        if index is None:
+            return []
+        return self.liked[self.user_starts[index]:self.user_starts[index + 1]].tolist()
+
+    def history(self, user):
+        """
+        Likes of a user in order of posts' dates, time of a like is unknown so the post date is used.
+        :param user: ID of the user
+        :return: list of (date, post ID) tuples
+        """
+        return sorted((self.dates[self._find(self.posts, post)], post) for post in self.liked_by(user))
+
+    def common_likers(self, posts):
+        """
+        Users who liked all given posts.
+        :param posts: list of posts' IDs
+        :return: sorted list of users' IDs
+        """
+        lists = sorted((self.likers_of(post) for post in posts), key=len)
+        return sorted(set(lists[0]).intersection(*lists[1:])) if lists else []
+
+    def common_liked(self, users):
+        """
+        Posts liked by all given users.
+        :param users: list of users' IDs
+        :return: sorted list of posts' IDs
+        """
+        lists = sorted((self.liked_by(user) for user in users), key=len)
+        return sorted(set(lists[0]).intersection(*lists[1:])) if lists else []
+
+    def close(self):
+        """
+        Closing the index.
+        """
+        for view in getattr(self, "_views", []):
+            view.release()
+        self._views = []
+        self._map.close()
+        self._file.close()
+
+
+class CoLikeGraph:
+    """
+    Sparse graph of the most active likers who like the same posts, for finding rings of accounts.
+    Similarity is counted row by row as the sparse product of the user x post matrix and its transpose, so
+    no dense matrix is made. Posts liked by too many of these users are skipped, they say nothing about rings.
+    Skipped posts are left out of both parts of the Jaccard index, so a ring is found by its likes of other posts
+    however many popular posts it likes too; users who like only popular posts are not compared at all.
+    """
+
+    def __init__(self, index, *, top=10000, max_likers=1000):
+        """
+        :param index: LikeIndex
+        :param top: number of the most active likers
+        :param max_likers: skip posts liked by more of these users
+        """
+        starts = index.user_starts
+        degrees = [starts[position + 1] - starts[position] for position in range(len(index.users))]
+        positions = heapq.nlargest(top, range(len(degrees)), key=degrees.__getitem__)
+        self.users = [index.users[position] for position in positions]
+        liked = [index.liked[starts[position]:starts[position + 1]].tolist() for position in positions]
+        self.post_likers = {}  # post ID: list of numbers of users
+        for number, posts in enumerate(liked):
+            for post in posts:
+                self.post_likers.setdefault(post, []).append(number)
+        self.post_likers = {post: users for post, users in self.post_likers.items() if len(users) <= max_likers}
+        self.liked = [[post for post in posts if post in self.post_likers] for posts in liked]
+        self.degrees = [len(posts) for posts in self.liked]  # over kept posts, like the common counts
+
+    def pairs(self, *, min_common=10, min_jaccard=0.5):
+        """
+        Pairs of users with high overlap of liked posts.
+        :param min_common: minimal number of posts liked by both users
+        :param min_jaccard: minimal Jaccard index of liked posts
+        :return: iterator over (user ID, user ID, common posts, Jaccard index) tuples
+        """
+        post_likers = self.post_likers
+        for number, posts in enumerate(self.liked):
+            common = Counter()
+            common.update(itertools.chain.from_iterable(post_likers.get(post, ()) for post in posts))
+            for other, count in common.items():
+                if other > number and count >= min_common:
+                    jaccard = count / (self.degrees[number] + self.degrees[other] - count)
+                    if jaccard >= min_jaccard:
+                        yield self.users[number], self.users[other], count, round(jaccard, 6)
+
+    @staticmethod
+    def clusters(pairs):
+        """
+        Connected groups of users.
+        :param pairs: pairs from pairs()
+        :return: list of sorted lists of users' IDs, the biggest groups first
+        """
+        parent = {}
+
+        def find(user):
+            root = user
+            while parent.setdefault(root, root) != root:
+                root = parent[root]
+            while parent[user] != root:
+                parent[user], user = root, parent[user]
+            return root
+
+        for first, second, count, jaccard in pairs:
+            parent[find(first)] = find(second)
+        groups = {}
+        for user in parent:
+            groups.setdefault(find(user), []).append(user)
+        return sorted((sorted(group) for group in groups.values()), key=lambda group: (-len(group), group[0]))
+
+
+DAY_SQL = "CAST(strftime('%s', date, 'unixepoch', 'localtime') AS INTEGER) / 86400"  # local_day() in SQLite
+
+
+class CrawlStore:
+    """
+    Local storage of crawled posts, likes and users, so statistics can be computed again without VK.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.executescript("""
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS posts (id INTEGER PRIMARY KEY, from_id INTEGER, likes INTEGER,
+                                              date INTEGER);
+            CREATE INDEX IF NOT EXISTS posts_date ON posts (date);
+            CREATE TABLE IF NOT EXISTS likes (post_id INTEGER, user_id INTEGER,
+                                              PRIMARY KEY (post_id, user_id)) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS users (id INTEGER PRIMARY KEY, screen_name TEXT, first_name TEXT,
+                                              last_name TEXT, deactivated TEXT);
+            CREATE TABLE IF NOT EXISTS daily (mode TEXT, day INTEGER, user_id INTEGER, count INTEGER,
+                                              PRIMARY KEY (mode, day, user_id)) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS daily_dirty (day INTEGER PRIMARY KEY);
+        """)
+        self._indexes = {}  # mode: DailyIndex
+
+    @classmethod
+    def for_wall(cls, name):
+        """
+        Storage for a wall in the results directory.
+        :param name: screen name of the wall
+        :return: CrawlStore
+        """
+        return cls("{}/crawl_{}.sqlite".format(results_dir(), name))
+
+    def set_wall(self, wall, name):
+        """
+        Saving ID and screen name of the wall.
+        :param wall: ID of the wall
+        :param name: screen name
+        """
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)", [("wall", str(wall)), ("name", name)])
+
+    @property
+    def wall(self):
+        """
+        ID of the wall.
+        """
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'wall'").fetchone()
+        return int(row[0]) if row else None
+
+    def add_posts(self, posts):
+        """
+        Saving posts.
+        :param posts: list of (id, from_id, likes, date) tuples
+        """
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO posts VALUES (?, ?, ?, ?)", posts)
+            self.db.executemany("INSERT OR IGNORE INTO daily_dirty VALUES (?)",
+                                ((day,) for day in {local_day(post[3]) for post in posts}))
+
+    def add_likes(self, likes):
+        """
+        Saving likers of posts, old likers of these posts are replaced.
+        :param likes: dictionary {post ID: list of likers}
+        """
+        with self.db:
+            self.db.executemany("DELETE FROM likes WHERE post_id = ?", [(post,) for post in likes])
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('like_index', 'old')")
+            self.db.executemany("INSERT OR IGNORE INTO daily_dirty SELECT {} FROM posts WHERE id = ?".format(
+                DAY_SQL), [(post,) for post in likes])
+            self.db.executemany("INSERT OR IGNORE INTO likes VALUES (?, ?)",
+                                ((post, user) for post, users in likes.items() for user in users))
+
+    def add_users(self, users):
+        """
+        Saving information about users.
+        :param users: list of users from users.get
+        """
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO users VALUES (?, ?, ?, ?, ?)",
+                                ((user["id"], user.get("screen_name"), user["first_name"], user["last_name"],
+                                  user.get("deactivated")) for user in users))
+
+    def users(self, users_list):
+        """
+        List of information about users, like Stats.users but without VK.
+        :param users_list: list of users' IDs
+        :return: dictionary {ID: user}
+        """
+        result = {}
+        for offset in range(0, len(users_list), 900):  # SQLite limit for variables
+            pack = users_list[offset:offset + 900]
+            for uid, screen_name, first_name, last_name, deactivated in self.db.execute(
+                    "SELECT * FROM users WHERE id IN ({})".format(",".join("?" * len(pack))), pack):
+                user = {"id": uid, "screen_name": screen_name or "id{}".format(uid),
+                        "first_name": first_name, "last_name": last_name}
+                if deactivated:
+                    user["deactivated"] = deactivated
+                    user["screen_name"] = deactivated.upper()
+                result[uid] = user
+        for uid in users_list:
+            if uid not in result:
+                result[uid] = {"id": uid, "screen_name": "id{}".format(uid), "first_name": "", "last_name": ""}
+        return result
+
+    def update_daily(self):
+        """
+        Counting activity by days again for days with new or changed posts and likes only.
+        :return: number of updated days
+        """
+        with self.db:
+            row = self.db.execute("SELECT value FROM meta WHERE key = 'daily_tz'").fetchone()
+            if row is None or row[0] != str(time.timezone):  # days depend on the timezone
+                self.db.execute("DELETE FROM daily")
+                self.db.execute("INSERT OR IGNORE INTO daily_dirty SELECT DISTINCT {} FROM posts".format(DAY_SQL))
+                self.db.execute("INSERT OR REPLACE INTO meta VALUES ('daily_tz', ?)", (str(time.timezone),))
+            first, last, total = self.db.execute("SELECT MIN(day), MAX(day), COUNT(*) FROM daily_dirty").fetchone()
+            if not total:
+                return 0
+            self.db.execute("DELETE FROM daily WHERE mode IN ('posts', 'liked', 'likers') AND "
+                            "day IN (SELECT day FROM daily_dirty)")
+            self.db.execute("CREATE TEMP TABLE dirty_posts AS SELECT id, from_id, likes, {} AS day FROM posts "
+                            "WHERE date >= ? AND date < ? AND day IN (SELECT day FROM daily_dirty)".format(DAY_SQL),
+                            ((first - 1) * 86400, (last + 2) * 86400))  # local days are shifted by 14 hours at most
+            # rows are grouped in the order of the primary key, so they are appended to the table
+            for query in ("INSERT INTO daily SELECT 'posts', day, from_id, COUNT(*) FROM dirty_posts "
+                          "GROUP BY day, from_id",
+                          "INSERT INTO daily SELECT 'liked', day, from_id, SUM(likes) FROM dirty_posts "
+                          "GROUP BY day, from_id",
+                          "INSERT INTO daily SELECT 'likers', dirty_posts.day, likes.user_id, COUNT(*) "
+                          "FROM dirty_posts JOIN likes ON likes.post_id = dirty_posts.id "
+                          "GROUP BY dirty_posts.day, likes.user_id",
+                          "DROP TABLE dirty_posts",
+                          "DELETE FROM daily_dirty"):
+                self.db.execute(query)
+        self._indexes = {}
+        return total
+
+    def daily_index(self, mode):
+        """
+        Counts of users by days, updated for new posts and likes.
+        :param mode: "posts", "liked" or "likers"
+        :return: DailyIndex
+        """
+        self.update_daily()
+        if mode not in self._indexes:
+            self._indexes[mode] = DailyIndex(self.db.execute(
+                "SELECT user_id, day, count FROM daily WHERE mode = ? ORDER BY user_id, day", (mode,)))
+        return self._indexes[mode]
+
+    def like_index(self):
+        """
+        Index of crawled likes in both directions, it is made again after new likes are saved.
+        :return: LikeIndex
+        """
+        path = "{}.likes".format(os.path.splitext(self.path)[0])
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'like_index'").fetchone()
+        if row is None or row[0] != "ok" or not os.path.exists(path):
+            log_write(_("Indexed {} likes").format(LikeIndex.build(self, path)))
+            with self.db:
+                self.db.execute("INSERT OR REPLACE INTO meta VALUES ('like_index', 'ok')")
+        return LikeIndex(path)
+
+    def counts(self, mode, *, since=None, until=None):
+        """
+        Counting activity of users by the daily index, so dates are rounded to whole days.
+        :param mode: "posts", "liked" or "likers"
+        :param since: the earliest date of post (timestamp)
+        :param until: the latest date of post (timestamp)
+        :return: list of (user ID, count) tuples, the most active users first
+        """
+        exclude = None if mode == "likers" else self.wall  # posts from others, like the "others" filter
+        return self.daily_index(mode).counts(local_day(since) if since else None,
+                                             local_day(until) if until else None, exclude=exclude)
+
+    def ranking(self, mode, *, since=None, until=None, top=0):
+        """
+        Statistics from the storage.
+        :param mode: "posts", "liked" or "likers"
+        :param since: the earliest date of post (timestamp)
+        :param until: the latest date of post (timestamp)
+        :param top: number of users, 0 is all
+        :return: list of (count, user) tuples, the most active users first
+        """
+        counts = self.counts(mode, since=since, until=until)
+        if top:
+            counts = counts[:top]
+        users = self.users([uid for uid, count in counts])
+        return [(count, users[uid]) for uid, count in counts]
+
+    def post_dates(self, *, since=None, until=None):
+        """
+        Authors and dates of posts as compact arrays.
+        :param since: the earliest date of post (timestamp)
+        :param until: the latest date of post (timestamp)
+        :return: array of authors' IDs and array of dates
+        """
+        from_ids = array("q")
+        dates = array("q")
+        for from_id, date in self.db.execute("SELECT from_id, date FROM posts WHERE date >= ? AND date <= ?",
+                                             (since or 0, until or 2 ** 62)):
+            from_ids.append(from_id)
+            dates.append(date)
+        return from_ids, dates
+
+    def like_dates(self, *, since=None, until=None):
+        """
+        Dates of posts with count of their likers, time of a like is unknown so the post date is used.
+        :param since: the earliest date of post (timestamp)
+        :param until: the latest date of post (timestamp)
+        :return: array of dates and array of counts
+        """
+        dates = array("q")
+        counts = array("q")
+        for date, count in self.db.execute("SELECT posts.date, COUNT(*) FROM likes JOIN posts ON posts.id = "
+                                           "likes.post_id WHERE posts.date >= ? AND posts.date <= ? "
+                                           "GROUP BY likes.post_id", (since or 0, until or 2 ** 62)):
+            dates.append(date)
+            counts.append(count)
+        return dates, counts
+
+    def audience(self, kind="all", *, since=None, until=None):
+        """
+        Active users of the wall.
+        :param kind: "posters", "likers" or "all"
+        :param since: the earliest date of post (timestamp)
+        :param until: the latest date of post (timestamp)
+        :return: sorted array of unique users' IDs
+        """
+        posters = "SELECT from_id FROM posts WHERE from_id > 0 AND date >= ?1 AND date <= ?2"
+        if since or until:
+            likers = ("SELECT likes.user_id FROM likes JOIN posts ON posts.id = likes.post_id "
+                      "WHERE posts.date >= ?1 AND posts.date <= ?2")
+        else:
+            likers = "SELECT user_id FROM likes WHERE ?1 <= ?2"
+        query = {"posters": posters, "likers": likers, "all": "{} UNION {}".format(posters, likers)}[kind]
+        users = array("q")  # sorted by SQLite, so there is no set of users in memory
+        users.extend(uid for uid, in self.db.execute("SELECT DISTINCT * FROM ({}) ORDER BY 1".format(query),
+                                                     (since or 0, until or 2 ** 62)))
+        return users
+
+    def close(self):
+        """
+        Closing the storage.
+        """
+        self.db.close()
+
+
+class JobQueue:
+    """
+    Queue of crawl jobs in SQLite, shared by worker processes on one host.
+    A worker claims a job for a lease and extends the lease by heartbeats. Jobs with expired leases are claimed
+    again, so jobs of dead workers are re-queued automatically. Locking of SQLite isn't reliable on network
+    filesystems, SpoolQueue is used for many hosts.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (id INTEGER PRIMARY KEY, args TEXT, state TEXT DEFAULT 'queued',
+                                             worker TEXT, lease_until REAL DEFAULT 0, attempts INTEGER DEFAULT 0,
+                                             max_attempts INTEGER, result TEXT, error TEXT, created REAL,
+                                             updated REAL);
+            CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, lease_until);
+        """)
+
+    def submit(self, args, *, max_attempts=3):
+        """
+        Adding a job.
+        :param args: arguments for gather() (dict)
+        :param max_attempts: number of tries before the job is failed
+        :return: ID of the job
+        """
+        now = time.time()
+        return self.db.execute("INSERT INTO jobs (args, max_attempts, created, updated) VALUES (?, ?, ?, ?)",
+                               (json.dumps(args), max_attempts, now, now)).lastrowid
+
+    def claim(self, worker, *, lease):
+        """
+        Taking a queued job or a job with expired lease.
+        :param worker: name of the worker
+        :param lease: time of the lease in seconds
+        :return: ID and arguments of the job or None
+        """
+        now = time.time()
+        self.db.execute("BEGIN IMMEDIATE")  # only one worker at once gets the job
+        try:
+            self.db.execute("UPDATE jobs SET state = 'failed', error = 'lease expired', updated = ? "
+                            "WHERE state = 'running' AND lease_until < ? AND attempts >= max_attempts", (now, now))
+            row = self.db.execute("SELECT id, args FROM jobs WHERE state = 'queued' OR "
+                                  "(state = 'running' AND lease_until < ?) ORDER BY id LIMIT 1", (now,)).fetchone()
+            if row:
+                self.db.execute("UPDATE jobs SET state = 'running', worker = ?, lease_until = ?, "
+                                "attempts = attempts + 1, updated = ? WHERE id = ?", (worker, now + lease, now, row[0]))
+            self.db.execute("COMMIT")
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        if row:
+            return row[0], json.loads(row[1])
+        return None
+
+    def heartbeat(self, job, worker, *, lease):
+        """
+        Extending the lease.
+        :param job: ID of the job
+        :param worker: name of the worker
+        :param lease: time of the lease in seconds
+        :return: False if the job was taken by another worker
+        """
+        now = time.time()
+        return self.db.execute("UPDATE jobs SET lease_until = ?, updated = ? WHERE id = ? AND worker = ? "
+                               "AND state = 'running'", (now + lease, now, job, worker)).rowcount > 0
+
+    def finish(self, job, worker, result):
+        """
+        Saving the result of the job.
+        :param job: ID of the job
+        :param worker: name of the worker
+        :param result: JSON-compatible result
+        """
+        self.db.execute("UPDATE jobs SET state = 'done', result = ?, error = NULL, updated = ? "
+                        "WHERE id = ? AND worker = ?",
+                        (json.dumps(result), time.time(), job, worker))
+
+    def fail(self, job, worker, error_text, *, permanent=False):
+        """
+        Re-queueing the job or failing it if there were too many attempts.
+        :param job: ID of the job
+        :param worker: name of the worker
+        :param error_text: description of the error
+        :param permanent: fail the job without other attempts, e.g. for wrong arguments
+        """
+        self.db.execute("UPDATE jobs SET state = CASE WHEN attempts < max_attempts AND NOT ? THEN 'queued' "
+                        "ELSE 'failed' END, lease_until = 0, error = ?, updated = ? WHERE id = ? AND worker = ?",
+                        (permanent, error_text, time.time(), job, worker))
+
+    def jobs(self):
+        """
+        List of all jobs.
+        :return: list of dictionaries
+        """
+        cursor = self.db.execute("SELECT id, args, state, worker, attempts, result, error FROM jobs ORDER BY id")
+        names = [column[0] for column in cursor.description]
+        return [dict(zip(names, row)) for row in cursor]
+
+    def close(self):
+        """
+        Closing the queue.
+        """
+        self.db.close()
+
+
+class SpoolQueue:
+    """
+    Queue of crawl jobs in a directory on a shared filesystem, for workers on many hosts. It has the interface of
+    JobQueue. Arguments of every job are written once to a file, the state is its subdirectory and the number of
+    attempts and the worker are in its name: queued/<id>.<attempts>.json, running/<id>.<attempts>.<worker>.json
+    (and done, failed).
+    Every change of the state is one rename, only one rename of a file succeeds even on network filesystems.
+    The modification time of a running job is the end of its lease.
+    """
+    states = ("queued", "running", "done", "failed")
+
+    def __init__(self, path):
+        self.path = path
+        for name in self.states + ("ids", "results", "errors", "tmp"):
+            os.makedirs(os.path.join(path, name), exist_ok=True)
+
+    def _file(self, state, job, attempts, worker=None):
+        name = "{}.{}.json".format(job, attempts)
+        if worker is not None:
+            name = "{}.{}.{}.json".format(job, attempts, worker.replace(os.sep, "_"))
+        return os.path.join(self.path, state, name)
+
+    def _list(self, state):
+        """
+        Jobs in a state.
+        :param state: name from states
+        :return: list of (ID, attempts, worker or None, file name) tuples sorted by IDs
+        """
+        result = []
+        for name in os.listdir(os.path.join(self.path, state)):
+            job, attempts, *worker = name[:-len(".json")].split(".", 2)
+            result.append((int(job), int(attempts), worker[0] if worker else None, name))
+        return sorted(result)
+
+    def _save(self, kind, job, data):
+        path = os.path.join(self.path, "tmp", "{}.{}.{}".format(job, os.getpid(), threading.get_ident()))
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(data, file)
+        os.rename(path, os.path.join(self.path, kind, "{}.json".format(job)))
+
+    def _load(self, kind, job):
+        try:
+            with open(os.path.join(self.path, kind, "{}.json".format(job)), encoding="utf-8") as file:
+                return json.load(file)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _move(self, source, target):
+        try:
+            os.rename(source, target)
+        except FileNotFoundError:  # taken by another worker
+            return False
+        return True
+
+    def _find(self, job, worker):
+        for found, attempts, owner, name in self._list("running"):
+            if found == job and owner == worker.replace(os.sep, "_"):
+                return attempts, os.path.join(self.path, "running", name)
+        return None, None
+
+    def submit(self, args, *, max_attempts=3):
+        """
+        Adding a job.
+        :param args: arguments for gather() (dict)
+        :param max_attempts: number of tries before the job is failed
+        :return: ID of the job
+        """
+        job = max((int(name) for name in os.listdir(os.path.join(self.path, "ids"))), default=0) + 1
+        while True:
+            try:  # IDs are reserved by exclusive creation of files
+                os.close(os.open(os.path.join(self.path, "ids", str(job)), os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                break
+            except FileExistsError:
+                job += 1
+        path = os.path.join(self.path, "tmp", "{}.{}".format(job, os.getpid()))
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump({"args": args, "max_attempts": max_attempts}, file)
+        os.rename(path, self._file("queued", job, 0))
+        return job
+
+    def claim(self, worker, *, lease):
+        """
+        Taking a queued job or a job with expired lease.
+        :param worker: name of the worker
+        :param lease: time of the lease in seconds
+        :return: ID and arguments of the job or None
+        """
+        now = time.time()
+        for job, attempts, owner, name in self._list("running"):
+            path = os.path.join(self.path, "running", name)
+            try:
+                if os.stat(path).st_mtime >= now:
+                    continue
+                with open(path, encoding="utf-8") as file:
+                    max_attempts = json.load(file)["max_attempts"]
+            except FileNotFoundError:  # finished or taken by another worker
+                continue
+            state = "failed" if attempts >= max_attempts else "queued"
+            if self._move(path, self._file(state, job, attempts)) and state == "failed":
+                self._save("errors", job, "lease expired")
+        for job, attempts, owner, name in self._list("queued"):
+            path = os.path.join(self.path, "queued", name)
+            try:
+                os.utime(path, (now + lease, now + lease))  # the lease starts with the rename
+            except FileNotFoundError:
+                continue
+            running = self._file("running", job, attempts + 1, worker)
+            if self._move(path, running):
+                with open(running, encoding="utf-8") as file:
+                    return job, json.load(file)["args"]
+        return None
+
+    def heartbeat(self, job, worker, *, lease):
+        """
+        Extending the lease.
+        :param job: ID of the job
+        :param worker: name of the worker
+        :param lease: time of the lease in seconds
+        :return: False if the job was taken by another worker
+        """
+        attempts, path = self._find(job, worker)
+        until = time.time() + lease
+        try:
+            os.utime(path or "", (until, until))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def finish(self, job, worker, result):
+        """
+        Saving the result of the job.
+        :param job: ID of the job
+        :param worker: name of the worker
+        :param result: JSON-compatible result
+        """
+        attempts, path = self._find(job, worker)
+        if path:
+            self._save("results", job, result)
+            if self._move(path, self._file("done", job, attempts, worker)):
+                try:
+                    os.remove(os.path.join(self.path, "errors", "{}.json".format(job)))
+                except FileNotFoundError:
+                    pass
+
+    def fail(self, job, worker, error_text, *, permanent=False):
+        """
+        Re-queueing the job or failing it if there were too many attempts.
+        :param job: ID of the job
+        :param worker: name of the worker
+        :param error_text: description of the error
+        :param permanent: fail the job without other attempts, e.g. for wrong arguments
+        """
+        attempts, path = self._find(job, worker)
+        if path:
+            with open(path, encoding="utf-8") as file:
+                max_attempts = json.load(file)["max_attempts"]
+            self._save("errors", job, error_text)
+            if permanent or attempts >= max_attempts:
+                self._move(path, self._file("failed", job, attempts, worker))
+            else:
+                self._move(path, self._file("queued", job, attempts))
+
+    def jobs(self):
+        """
+        List of all jobs.
+        :return: list of dictionaries like in JobQueue.jobs()
+        """
+        result = []
+        for state in self.states:
+            for job, attempts, worker, name in self._list(state):
+                try:
+                    with open(os.path.join(self.path, state, name), encoding="utf-8") as file:
+                        args = json.load(file)["args"]
+                except FileNotFoundError:  # moved to another state
+                    continue
+                done = self._load("results", job) if state == "done" else None
+                result.append({"id": job, "args": json.dumps(args), "state": state, "worker": worker,
+                               "attempts": attempts, "result": None if done is None else json.dumps(done),
+                               "error": self._load("errors", job)})
+        return sorted(result, key=lambda job: job["id"])
+
+    def close(self):
+        """
+        Closing the queue.
+        """
+
+class ResultCache:
+    """
+    Cache of ratings for the HTTP service.
+    Missing ratings are gathered while the client waits, stale ones are returned at once and gathered again in
+    background. Requests for a rating which is being gathered wait for the same crawl. Failures are cached for
+    error_ttl seconds, so a bad wall isn't crawled again for every request. Only max_entries ratings are kept,
+    the least recently used ones are dropped.
+    """
+
+    def __init__(self, token, *, ttl=3600, error_ttl=60, max_entries=256, threads=2, crawl_args=None):
+        self.token = token
+        self.ttl = ttl
+        self.error_ttl = error_ttl
+        self.max_entries = max_entries
+        self.crawl_args = crawl_args or {}
+        self.entries = OrderedDict()  # (wall, mode): (time, rating, exception), the least recently used first
+        self.pending = {}  # (wall, mode): Future
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=threads)
+
+    def _crawl(self, key):
+        wall, mode = key
+        try:
+            args = dict({"posts": 0, "date": "0/0/0", "threads": 4, "no_store": False}, **self.crawl_args)
+            stats_mode = MODES[mode](memory_limit=args.get("memory_limit", 0))
+            stats, store = open_stats(dict(args, wall=wall), self.token, modes=[stats_mode])
+            try:
+                entry = (time.time(), list(ranking(stats.gather_modes([stats_mode])[mode])), None)
+            finally:
+                if store:
+                    store.close()
+        except Exception as err:
+            log_write(_("Can't gather '{}' ({}): {!r}").format(wall, mode, err), to=sys.stderr)
+            entry = (time.time(), None, err)
+        with self._lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            del self.pending[key]
+        return entry
+
+    def refresh(self, wall, mode):
+        """
+        Gathering a rating again, only one crawl for a rating is running at once.
+        :param wall: screen name of the wall
+        :param mode: mode of stats
+        :return: concurrent.futures.Future with time, rating and exception
+        """
+        key = (wall, mode)
+        with self._lock:
+            if key not in self.pending:
+                self.pending[key] = self._executor.submit(self._crawl, key)
+            return self.pending[key]
+
+    def get(self, wall, mode):
+        """
+        Cached rating.
+        :param wall: screen name of the wall
+        :param mode: mode of stats
+        :return: time of gathering and list of (count, user) tuples
+        :raise: exception of the failed crawl
+        """
+        key = (wall, mode)
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+        if entry is None or (entry[2] is not None and time.time() - entry[0] > self.error_ttl):
+            entry = self.refresh(wall, mode).result()
+        elif entry[2] is None and time.time() - entry[0] > self.ttl:
+            self.refresh(wall, mode)
+        if entry[2] is not None:
+            raise entry[2]
+        return entry[:2]
+
+
+class StatsRequestHandler(BaseHTTPRequestHandler):
+    """
+    JSON API for ratings: GET /stats/<wall>?mode=posts&offset=0&limit=100&top=0
+    """
+    cache = None  # ResultCache, set by serve()
+
+    def _send(self, code, data):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        """
+        Answering a request.
+        """
+        url = urlparse(self.path)
+        parts = url.path.strip("/").split("/")
+        query_args = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        if len(parts) != 2 or parts[0] != "stats" or not parts[1]:
+            return self._send(404, {"error": "not found"})
+        mode = query_args.get("mode", "posts")
+        try:
+            offset = max(int(query_args.get("offset", 0)), 0)
+            limit = min(max(int(query_args.get("limit", 100)), 0), 1000)
+            top = max(int(query_args.get("top", 0)), 0)
+        except ValueError:
+            return self._send(400, {"error": "offset, limit and top must be integers"})
+        if mode not in MODES:
+            return self._send(400, {"error": "unknown mode"})
+        try:
+            updated, rating = self.cache.get(parts[1], mode)
+        except WallNotFoundError as err:
+            return self._send(404, {"error": str(err)})
+        except VKError as err:
+            return self._send(502, {"error": str(err)})
+        except Exception as err:  # logged by the cache
+            return self._send(500, {"error": "{}: {}".format(type(err).__name__, err)})
+        total = min(top, len(rating)) if top else len(rating)
+        rows = [{"rank": rank, "id": user["id"], "screen_name": user.get("screen_name"),
+                 "first_name": user["first_name"], "last_name": user["last_name"], "count": count}
+                for rank, (count, user) in enumerate(rating[offset:min(offset + limit, total)], offset + 1)]
+        self._send(200, {"wall": parts[1], "mode": mode, "updated": updated, "total": total, "rows": rows})
+
+    def log_message(self, format, *args):
+        log_write(format % args)
+
+
+class StatsHTTPServer(ThreadingMixIn, HTTPServer):
+    """
+    HTTP server answering every request in its own thread.
+    """
+    daemon_threads = True
+
+
+def parse_size(size):
+    """
+    Converting size with K, M or G suffix to bytes.
+    :param size: string like "512M"
+    :return: number of bytes
+    """
+    size = size.strip().upper()
+    multiplier = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}.get(size[-1:], 1)
+    if multiplier > 1:
+        size = size[:-1]
+    return int(float(size) * multiplier)
+
+
+def parse_part(part):
+    """
+    Converting a part for sampling.
+    :param part: string like "0.05"
+    :return: number in the (0, 1] range
+    """
+    part = float(part)
+    if not 0 < part <= 1:
+        raise argparse.ArgumentTypeError(_("part must be in the (0, 1] range"))
+    return part
+
+
+class SpillingCounter:
+    """
+    Counter which keeps counts in memory up to the limit and then spills them sorted to temporary files.
+    The files are merged at the end, so results are the same as without the limit.
+    """
+    entry_size = 100  # approximate size of a dictionary entry with two integers in bytes
+    read_size = 1 << 15
+
+    def __init__(self, memory_limit=0):
+        self.max_entries = memory_limit // self.entry_size if memory_limit else 0
+        self.counts = {}
+        self.spills = []
+
+    def update(self, ids):
+        """
+        Counting IDs.
+        :param ids: iterable of integers
+        """
+        counts = self.counts
+        for uid in ids:
+            counts[uid] = counts.get(uid, 0) + 1
+        if self.max_entries and len(counts) > self.max_entries:
+            self._spill()
+
+    def add(self, uid, count):
+        """
+        Adding a count to an ID.
+        :param uid: integer ID
+        :param count: number to add
+        """
+        self.counts[uid] = self.counts.get(uid, 0) + count
+        if self.max_entries and len(self.counts) > self.max_entries:
+            self._spill()
+
+    def _spill(self):
+        pairs = array("q")
+        for uid in sorted(self.counts):
+            pairs.append(uid)
+            pairs.append(self.counts[uid])
+        spill = tempfile.TemporaryFile(prefix="sysrq-")
+        pairs.tofile(spill)
+        spill.seek(0)
+        if not self.spills:  # once, there can be many spills
+            log_write(_("Counts don't fit in the memory limit, spilling them to disk"))
+        self.spills.append(spill)
+        self.counts = {}
+
+    def _read_spill(self, spill):
+        while True:
+            pairs = array("q")
+            try:
+                pairs.fromfile(spill, self.read_size)
+            except EOFError:
+                pass  # the last part is read anyway
+            if not pairs:
+                spill.close()
+                return
+            for index in range(0, len(pairs), 2):
+                yield pairs[index], pairs[index + 1]
+
+    def items(self):
+        """
+        All counts sorted by IDs, the counter can't be used after that.
+        :return: iterator over (ID, count) tuples
+        """
+        in_memory = sorted(self.counts.items())
+        self.counts = {}
+        if not self.spills:
+            return iter(in_memory)
+        log_write(_("Merging {} parts of counts from disk").format(len(self.spills)))
+        parts = [self._read_spill(spill) for spill in self.spills] + [iter(in_memory)]
+        self.spills = []
+        merged = heapq.merge(*parts)
+        return ((uid, sum(count for uid, count in group))
+                for uid, group in itertools.groupby(merged, key=lambda pair: pair[0]))
+
+
+MASK64 = (1 << 64) - 1
+
+
+def hash64(number, seed=0):
+    """
+    Mixing an integer into 64 random-looking bits (splitmix64).
+    :param number: integer
+    :param seed: integer for independent hash functions
+    :return: 64-bit integer
+    """
+    number = (number + seed * 0x9E3779B97F4A7C15 + 0x9E3779B97F4A7C15) & MASK64
+    number = ((number ^ (number >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    number = ((number ^ (number >> 27)) * 0x94D049BB133111EB) & MASK64
+    return number ^ (number >> 31)
+
+
+class CountMinSketch:
+    """
+    Approximate counts in fixed memory, estimates are never lower than real counts.
+    With width w and depth d an estimate exceeds the count by more than e/w * total with probability e^-d.
+    """
+
+    def __init__(self, width=1 << 14, depth=4, table=None):
+        self.width = width
+        self.depth = depth
+        self.table = table if table is not None else array("q", bytes(8 * width * depth))
+
+    def add(self, item, count=1):
+        """
+        Counting an item.
+        :param item: integer
+        :param count: weight
+        """
+        for row in range(self.depth):
+            self.table[row * self.width + hash64(item, row) % self.width] += count
+
+    def estimate(self, item):
+        """
+        Estimated count of an item.
+        :param item: integer
+        :return: count, not lower than the real one
+        """
+        return min(self.table[row * self.width + hash64(item, row) % self.width] for row in range(self.depth))
+
+    def merge(self, other):
+        """
+        Adding counts from another sketch with the same size.
+        :param other: CountMinSketch
+        """
+        if (self.width, self.depth) != (other.width, other.depth):
+            raise ValueError("Sketches have different sizes")
+        for index, count in enumerate(other.table):
+            self.table[index] += count
+
+
+class SpaceSaving:
+    """
+    Heavy hitters in fixed memory: only k items are counted, a new item replaces the least counted one.
+    Every count is at most "error" higher than the real count, and error is never bigger than total / k.
+    """
+
+    def __init__(self, k=1000):
+        self.k = k
+        self.counts = {}
+        self.errors = {}
+        self.total = 0
+        self._heap = []  # (count, item), old entries are skipped lazily
+
+    def _min(self):
+        while True:
+            count, item = self._heap[0]
+            if self.counts.get(item) == count:
+                return count, item
+            heapq.heappop(self._heap)
+
+    def add(self, item, count=1):
+        """
+        Counting an item.
+        :param item: integer
+        :param count: weight
+        """
+        self.total += count
+        if item in self.counts:
+            self.counts[item] += count
+        elif len(self.counts) < self.k:
+            self.counts[item] = count
+            self.errors[item] = 0
+        else:
+            min_count, min_item = self._min()
+            del self.counts[min_item], self.errors[min_item]
+            self.counts[item] = min_count + count
+            self.errors[item] = min_count
+        heapq.heappush(self._heap, (self.counts[item], item))
+        if len(self._heap) > 4 * self.k:
+            self._heap = [(value, key) for key, value in self.counts.items()]
+            heapq.heapify(self._heap)
+
+    def min_count(self):
+        """
+        Count of the least counted item, it's an upper bound for items which are not counted.
+        """
+        return self._min()[0] if len(self.counts) >= self.k else 0
+
+    def merge(self, other):
+        """
+        Adding another summary, the result has the same guarantees for both streams together.
+        :param other: SpaceSaving
+        """
+        own_min, other_min = self.min_count(), other.min_count()
+        counts = {}
+        errors = {}
+        for item in set(self.counts) | set(other.counts):
+            counts[item] = self.counts.get(item, own_min) + other.counts.get(item, other_min)
+            errors[item] = self.errors.get(item, own_min) + other.errors.get(item, other_min)
+        top = heapq.nlargest(self.k, counts, key=counts.get)
+        self.counts = {item: counts[item] for item in top}
+        self.errors = {item: errors[item] for item in top}
+        self.total += other.total
+        self._heap = [(value, key) for key, value in self.counts.items()]
+        heapq.heapify(self._heap)
+
+    def top(self):
+        """
+        Counted items, the most frequent first.
+        :return: list of (item, count, error) tuples
+        """
+        return sorted(((item, count, self.errors[item]) for item, count in self.counts.items()),
+                      key=lambda row: row[1], reverse=True)
+
+
+class HyperLogLog:
+    """
+    Approximate number of distinct items in fixed memory, standard error is 1.04 / sqrt(2 ** precision).
+    """
+
+    def __init__(self, precision=14, registers=None):
+        self.precision = precision
+        self.registers = registers if registers is not None else bytearray(1 << precision)
+
+    def add(self, item):
+        """
+        Adding an item.
+        :param item: integer
+        """
+        number = hash64(item, 0x5EED)
+        index = number >> (64 - self.precision)
+        rest = (number << self.precision) & MASK64
+        rank = 64 - self.precision + 1 if not rest else 65 - rest.bit_length()
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        """
+        Adding items of another sketch with the same precision.
+        :param other: HyperLogLog
+        """
+        if self.precision != other.precision:
+            raise ValueError("Sketches have different precision")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self):
+        """
+        Estimated number of distinct items.
+        :return: estimate and standard error
+        """
+        size = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / size)
+        estimate = alpha * size * size / sum(2.0 ** -rank for rank in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * size and zeros:
+            estimate = size * math.log(size / zeros)  # linear counting is better for small numbers
+        return int(round(estimate)), 1.04 / math.sqrt(size)
+
+
+class AudienceSketch:
+    """
+    Approximate statistics in fixed memory: heavy hitters (Space-Saving checked by Count-Min) and number of
+    distinct users (HyperLogLog). Sketches from several walls or shards can be merged.
+    """
+
+    def __init__(self, k=1000):
+        self.heavy = SpaceSaving(k)
+        self.cms = CountMinSketch()
+        self.hll = HyperLogLog()
+
+    def add(self, user, count=1):
+        """
+        Counting a user.
+        :param user: ID of the user
+        :param count: weight
+        """
+        self.heavy.add(user, count)
+        self.cms.add(user, count)
+        self.hll.add(user)
+
+    def merge(self, other):
+        """
+        Adding another sketch.
+        :param other: AudienceSketch
+        """
+        self.heavy.merge(other.heavy)
+        self.cms.merge(other.cms)
+        self.hll.merge(other.hll)
+
+    def top(self, number=0):
+        """
+        The most active users with bounds of their counts.
+        :param number: number of users, 0 is all counted
+        :return: list of (user ID, estimate, low bound, high bound) tuples
+        """
+        result = []
+        for user, count, error in self.heavy.top():
+            high = min(count, self.cms.estimate(user))  # both are upper bounds
+            result.append((user, high, max(count - error, 0), high))
+        result.sort(key=lambda row: row[1], reverse=True)
+        return result[:number] if number else result
+
+    def summary(self, number=0):
+        """
+        JSON-compatible description of results and their errors.
+        :param number: number of users, 0 is all counted
+        """
+        distinct, error = self.hll.count()
+        return {"total": self.heavy.total,
+                "distinct": {"estimate": distinct, "relative_error": round(error, 4)},
+                "max_error": self.heavy.total // self.heavy.k,
+                "cms_error": round(math.e / self.cms.width * self.heavy.total, 1),
+                "top": [{"id": user, "count": count, "low": low, "high": high}
+                        for user, count, low, high in self.top(number)]}
+
+    def to_dict(self):
+        """
+        State of the sketch for saving to JSON.
+        """
+        return {"k": self.heavy.k, "total": self.heavy.total,
+                "heavy": [[user, count, self.heavy.errors[user]] for user, count in self.heavy.counts.items()],
+                "cms": {"width": self.cms.width, "depth": self.cms.depth,
+                        "table": base64.b64encode(self.cms.table.tobytes()).decode("ascii")},
+                "hll": {"precision": self.hll.precision,
+                        "registers": base64.b64encode(bytes(self.hll.registers)).decode("ascii")}}
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Restoring a saved sketch.
+        :param data: result of to_dict()
+        :return: AudienceSketch
+        """
+        sketch = cls(data["k"])
+        for user, count, error in data["heavy"]:
+            sketch.heavy.counts[user] = count
+            sketch.heavy.errors[user] = error
+            sketch.heavy._heap.append((count, user))
+        heapq.heapify(sketch.heavy._heap)
+        sketch.heavy.total = data["total"]
+        table = array("q")
+        table.frombytes(base64.b64decode(data["cms"]["table"]))
+        sketch.cms = CountMinSketch(data["cms"]["width"], data["cms"]["depth"], table)
+        sketch.hll = HyperLogLog(data["hll"]["precision"], bytearray(base64.b64decode(data["hll"]["registers"])))
+        return sketch
+
+
+def sample_estimates(page_counts, pages_total, *, z=1.96):
+    """
+    Estimating counts of the whole wall from a simple random sample of pages.
+    Every page is a cluster, so totals are N * mean(y) and their variance is N^2 * (1 - n/N) * s^2 / n.
+    :param page_counts: list of collections.Counter {user ID: count} for every sampled page
+    :param pages_total: number of pages on the wall
+    :param z: quantile of normal distribution for confidence intervals (1.96 for 95%)
+    :return: list of dictionaries with user ID, estimate, bounds and reliability of the rank
+    """
+    sampled = len(page_counts)
+    if not sampled:  # empty wall
+        return []
+    sums = Counter()
+    squares = Counter()
+    for counts in page_counts:
+        for user, count in counts.items():
+            sums[user] += count
+            squares[user] += count * count
+    scale = pages_total / sampled
+    correction = 1 - sampled / pages_total
+    result = []
+    for user, total in sums.items():
+        if sampled > 1:
+            variance = (squares[user] - total * total / sampled) / (sampled - 1)  # zeros of other pages included
+        else:
+            variance = float(total * total)
+        margin = z * pages_total * math.sqrt(max(variance, 0) * correction / sampled)
+        estimate = total * scale
+        result.append({"id": user, "estimate": round(estimate, 1), "low": round(max(estimate - margin, 0), 1),
+                       "high": round(estimate + margin, 1)})
+    result.sort(key=lambda row: row["estimate"], reverse=True)
+    for rank, row in enumerate(result):
+        row["rank"] = rank + 1
+        above = result[rank - 1]["low"] if rank else float("inf")
+        below = result[rank + 1]["high"] if rank + 1 < len(result) else float("-inf")
+        row["reliable"] = row["high"] < above and row["low"] > below  # intervals of neighbours don't overlap
+    return result
+
+
+MODES = {}  # name: StatsMode subclass
+
+
+def register_mode(cls):
+    """
+    Adding a mode of stats to the registry, plugins use it as a class decorator.
+    :param cls: StatsMode subclass
+    :return: the same class
+    """
+    MODES[cls.name] = cls
+    return cls
+
+
+class StatsMode:
+    """
+    Mode of stats: it declares data which it needs and counts users.
+    Stats.gather_modes() fetches every kind of data once and gives it to all modes.
+    """
+    name = None
+    prefix = None  # prefix for files
+    needs = frozenset({"posts"})  # "posts" (with counters of likes, comments and reposts), "likes", "comments"
+    wall_filter = "others"  # "others" modes don't see posts of the owner of the wall
+
+    def __init__(self, *, memory_limit=0):
+        self.counter = SpillingCounter(memory_limit)
+
+    def add_post(self, post):
+        """
+        Counting a post.
+        :param post: item of Stats.posts_list()
+        """
+
+    def add_likes(self, post, likers):
+        """
+        Counting likes of a post.
+        :param post: item of Stats.posts_list()
+        :param likers: list of users' IDs
+        """
+
+    def add_comments(self, post, from_ids):
+        """
+        Counting a page of comments or replies of a post.
+        :param post: item of Stats.posts_list()
+        :param from_ids: list of authors' IDs
+        """
+
+    def counts(self):
+        """
+        Counted users, the mode can't be used after that.
+        :return: iterator over (user ID, count) tuples
+        """
+        return self.counter.items()
+
+
+@register_mode
+class PostsMode(StatsMode):
+    """
+    Count of posts of every user
+    """
+    name = "posts"
+    prefix = "posts"
+
+    def add_post(self, post):
+        self.counter.add(post["data"][0], 1)
+
+
+@register_mode
+class LikedMode(StatsMode):
     """
-    Checking for updates
+    Count of likes collected by posts of every user
     """
-    latest_file = request.urlopen(
-        "http://net2ftp.ru/node0/CyberTailor@gmail.com/versions.json").read().decode("utf-8")
-    latest = json.loads(latest_file)["vk_stats"]
-    if latest["number"] > v_number:
-        if console:
-            log_write(_("Found the update to version {}!\n\nChangelog:").format(latest["version"]))
-            print(request.urlopen(
-                "http://net2ftp.ru/node0/CyberTailor@gmail.com/vk_stats.CHANGELOG").read().decode("utf-8"))
-            choice = input(_("\nUpgrade? (Y/n)")).lower()
-            update_prompt = {"n": False, "not": False, "н": False, "нет": False}.get(choice, True)
-            if update_prompt:
-                upgrade(version=latest["version"])
-            else:
-                log_write(_("Passing the update...\n"))
-        else:
-            return latest["version"]
-    else:
-        if console:
-            log_write(_("You running the latest version\n"))
+    name = "liked"
+    prefix = "likes"
 
+    def add_post(self, post):
+        from_id, likes = post["data"]
+        self.counter.add(from_id, likes)
 
-def login():
+
+@register_mode
+class LikersMode(StatsMode):
     """
-    Authorisation in https://vk.com
-    :return: access_token for VK
+    Count of likes done by every user
     """
-    print(_("If you're afraid of losing the account, then:\n" +
-            "\t1) Go to http://vk.cc/3T1J9A\n" +
-            "\t2) Login and give permissions to app\n" +
-            "\t3) Copy part of an urlbar, which is containing the access_token\n" +
-            "\t4) Create a file 'token.txt' in home directory and write to one your access token"))
-    email = input(_("Your login: "))
-    password = getpass(_("Your password: "))
-    app_id = 4589594
-    token = auth(email, password, app_id, ["stats", "groups", "wall"])[0]
-    token_file = open("{}/token.txt".format(HOME), mode="w")
-    token_file.write(token)
-    return token
+    name = "likers"
+    prefix = "likers"
+    needs = frozenset({"posts", "likes"})
+    wall_filter = "all"
 
+    def add_likes(self, post, likers):
+        self.counter.update(likers)
 
-def call_api(method, *, token, params):
+
+@register_mode
+class CommentersMode(StatsMode):
     """
-    Calling VK API
-    :param method: method name from https://vk.com/dev/methods
-    :param params: parameters for method (dict)
-    :param token: access_token
-    :return: result of calling API method
+    Count of comments and replies of every user
     """
-    params.update({"access_token": token, "v": api_ver})
-    data = urlencode(params)
-    headers = {"Content-length": str(len(data))}
-    url = "https://api.vk.com/method/" + method
-    req = request.Request(url, data=bytes(data, encoding="utf-8"), headers=headers)
-    result = None
+    name = "commenters"
+    prefix = "commenters"
+    needs = frozenset({"posts", "comments"})
+    wall_filter = "all"
 
-    while result is None:
-        try:
-            result = json.loads(request.urlopen(req, timeout=5).read().decode("utf-8"))
-        except (urllib.error.URLError, socket.error) as err:
-            log_write(_("Error: {}. Waiting for 10 seconds...").format(err))
-            time.sleep(10)
-    if "error" in result:
-        if console:
-            log_write("VK API {error_code}: {error_msg}".format(**result["error"]), to=sys.stderr)
-            exit()
-        else:
-            error(primary="VK API {error_code}".format(**result["error"]), secondary=result["error"]["error_msg"])
-    time.sleep(0.33)
-    return result["response"]
+    def add_comments(self, post, from_ids):
+        self.counter.update(uid for uid in from_ids if uid > 0)  # skip comments from groups
 
 
-def percents(el, seq):
+@register_mode
+class CommentedMode(StatsMode):
     """
-    Computing progress for sequence.
-    :param el: element
-    :param seq: sequence
-    :return: number of percents
+    Count of comments collected by posts of every user
     """
-    return (seq.index(el) + 1) * 100 // len(seq)
+    name = "commented"
+    prefix = "comments"
+
+    def add_post(self, post):
+        self.counter.add(post["data"][0], post["comments"])
+
+
+@register_mode
+class RepostedMode(StatsMode):
+    """
+    Count of reposts collected by posts of every user
+    """
+    name = "reposted"
+    prefix = "reposts"
+
+    def add_post(self, post):
+        self.counter.add(post["data"][0], post["reposts"])
+
+
+def load_plugins(path=None):
+    """
+    Importing modes of stats from Python files, they register modes with the register_mode decorator.
+    :param path: directory with plugins [plugins directory near this script]
+    :return: list of imported modules
+    """
+    path = path or "{}/plugins".format(SCRIPTDIR)
+    if not os.path.isdir(path):
+        return []
+    sys.modules.setdefault("stats", sys.modules[__name__])  # plugins import this module even if it is run as script
+    modules = []
+    for file_name in sorted(os.listdir(path)):
+        if file_name.endswith(".py") and not file_name.startswith("_"):
+            spec = importlib.util.spec_from_file_location("stats_plugin_" + file_name[:-3],
+                                                          os.path.join(path, file_name))
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            modules.append(module)
+    return modules
 
 
 class Stats:
     """
     Gathering statistics
     """
-
-    def __init__(self, name, *, token, posts_lim=0, date_lim="0/0/0", wall_filter="others"):
+    slim = True  # download only IDs, authors, dates and counters of posts
+    posts_full = None
+    mode_name = "posts"  # mode from MODES gathered by gather_stats()
+    pipeline_size = 4  # downloaded packs of every stage waiting for processing
+    posts_pack = 2500  # posts downloaded by one request
+    likes_backlog = 5000  # posts waiting for likers, reading of the wall is paused above it
+
+    def __init__(self, name, *, token, posts_lim=0, date_lim="0/0/0", wall_filter="others", store=None,
+                 memory_limit=0, approximate=False, sketch_size=1000, sample=0, threads=4):
         self.token = token
+        self.threads = threads
+        self.sample = sample
+        self.memory_limit = memory_limit
+        self.approximate = approximate
+        self.sketch_size = sketch_size
         self.screen_name = name
         self.filter = wall_filter
+        self.store = store
+        self.date_lim = parse_date(date_lim)  # before requests, so wrong dates fail at once
 
         # ID of a wall
         owner_wall_data = call_api("utils.resolveScreenName", params={"screen_name": self.screen_name},
                                    token=self.token)
+        if not owner_wall_data:  # VK returns an empty list for unknown names
+            raise WallNotFoundError(_("Wall '{}' is not found").format(self.screen_name))
         owner_wall_type = owner_wall_data["type"]
         owner_obj_id = owner_wall_data["object_id"]
 
@@ -238,6 +2676,8 @@ class Stats:
                                                                       "fields": "screen_name"},
                                           token=self.token)[0]
             self.wall = owner_profile_data["id"]
+        if self.store:
+            self.store.set_wall(self.wall, self.screen_name)
 
         # limit for posts
         if not posts_lim:
@@ -248,19 +2688,11 @@ class Stats:
         log_write(_("Limited to {} posts").format(self.posts_lim))
 
         # date limit
-        date_list = date_lim.split("/")
-        if not len(date_list) == 3:
-            print(_("Incorrect date!"), file=sys.stderr)
-            exit()
-        if not int("".join(date_list)):
-            self.date_lim = None
-        else:
-            self.date_lim = time.mktime((int(date_list[0]), int(date_list[1]), int(date_list[2]), 0, 0, 0, 0, 0, 0))
+        if self.date_lim:
             log_write(_("Limited to {} date").format(date_lim))
 
-    def _check_limit(self, data):
+    def _check_limit(self, date):
         if self.date_lim:
-            date = data["date"]
             if date < self.date_lim:
                 log_write(_("Reached the limit for date."))
                 return True
@@ -290,7 +2722,7 @@ class Stats:
 
         for post in range(thousands_range):
             if offset > 0:
-                if self._check_limit(posts[-1]):
+                if self._check_limit(posts[-1]["date"]):
                     return posts
             cur_progress = percents(offset, limit_list)
             if cur_progress > progress:
@@ -300,7 +2732,7 @@ class Stats:
             offset += 1000
         for post in range(hundreds_range):
             if offset > 0:
-                if self._check_limit(posts[-1]):
+                if self._check_limit(posts[-1]["date"]):
                     return posts
             cur_progress = percents(offset, limit_list)
             if cur_progress > progress:
@@ -310,27 +2742,80 @@ class Stats:
             offset += 100
         return posts
 
-    def posts_list(self):
+    def _get_slim_pack(self, *, offset, count):
+        code = SLIM_POSTS_CODE.format(wall=self.wall, filter=self.filter, offset=offset, pages=-(-count // 100))
+        data = call_api("execute", params={"code": code}, token=self.token)
+        return {"id": array("q", data["id"]), "from_id": array("q", data["from_id"]),
+                "likes": array("q", (likes["count"] for likes in data["likes"])),
+                "comments": array("q", (comments["count"] for comments in data["comments"])),
+                "reposts": array("q", (reposts["count"] for reposts in data["reposts"])),
+                "date": array("q", data["date"])}
+
+    def _fetch_post_packs(self):
         """
-        Making list of posts with senders' IDs and count of likes.
-        :return: list of posts
+        Downloading posts by packs.
+        Only needed fields are downloaded if the "slim" attribute is set, otherwise full posts are kept in the
+        "posts_full" attribute.
+        :return: iterator over dictionaries of columns
+        """
+        if self.slim:
+            progress = 0
+            for offset in range(0, self.posts_lim, self.posts_pack):
+                cur_progress = offset * 100 // self.posts_lim
+                if cur_progress > progress:
+                    progress = cur_progress
+                    log_write(_("Getting posts: {}%").format(cur_progress))
+                pack = self._get_slim_pack(offset=offset, count=min(self.posts_pack, self.posts_lim - offset))
+                yield pack
+                if not pack["date"] or (self.date_lim and pack["date"][-1] < self.date_lim):
+                    return
+            return
+        self.posts_full = self._get_posts()
+        yield {"id": [data["id"] for data in self.posts_full],
+               "from_id": [data["from_id"] for data in self.posts_full],
+               "likes": [data["likes"]["count"] for data in self.posts_full],
+               "comments": [data["comments"]["count"] for data in self.posts_full],
+               "reposts": [data.get("reposts", {}).get("count", 0) for data in self.posts_full],
+               "date": [data["date"] for data in self.posts_full]}
+
+    def _post_rows(self, pack):
+        """
+        Making posts from a pack of columns and saving them to the store.
+        :param pack: dictionary of columns from _fetch_post_packs()
+        :return: list of posts and True if the limit for date is reached
         """
-        posts = self._get_posts()
         result = []
-        progress = 0
-
-        for data in posts:
-            post_id = data["id"]
-            from_id = data["from_id"]
-            likes = data["likes"]["count"]
-            if self._check_limit(data):
+        stored = []
+        reached = False
+        for post_id, from_id, likes, comments, reposts, date in zip(pack["id"], pack["from_id"], pack["likes"],
+                                                                    pack["comments"], pack["reposts"],
+                                                                    pack["date"]):
+            if self._check_limit(date):
+                reached = True
                 break
-            cur_progress = percents(data, posts)
-            if cur_progress > progress:
-                progress = cur_progress
-                log_write(_("Processing posts: {}%").format(cur_progress))
-            result.append({"data": (from_id, likes), "id": post_id})
-        return result
+            result.append({"data": (from_id, likes), "id": post_id, "comments": comments, "reposts": reposts})
+            stored.append((post_id, from_id, likes, date))
+        if self.store and stored:
+            self.store.add_posts(stored)
+        return result, reached
+
+    def iter_posts(self):
+        """
+        Posts by packs, so the whole wall isn't kept in memory.
+        :return: iterator over lists of posts like in posts_list()
+        """
+        for pack in self._fetch_post_packs():
+            posts, reached = self._post_rows(pack)
+            yield posts
+            if reached:
+                return
+
+    def posts_list(self):
+        """
+        Making list of posts with senders' IDs and counters of likes, comments and reposts.
+        :return: list of posts
+        """
+        return list(itertools.chain.from_iterable(self.iter_posts()))
 
     def users(self, users_list):
         """
@@ -351,240 +2836,969 @@ class Stats:
             if cur_progress > progress:
                 log_write(_("Getting list of users: {}%").format(cur_progress))
             data = call_api("users.get", params={"user_ids": users, "fields": "screen_name"}, token=self.token)
+            if self.store:
+                self.store.add_users(data)
             result.extend(data)
             del users_list[:1001]
         return result
 
-    def likers(self):
+    def _get_likes_pack(self, pack):
+        code = LIKES_CODE.format(wall=self.wall, posts=",".join(str(post) for post in pack))
+        data = call_api("execute", params={"code": code}, token=self.token)
+        return {post: likers or [] for post, likers in zip(pack, data)}
+
+    def _get_users_pack(self, pack):
+        return call_api("users.get", params={"user_ids": ",".join(str(user) for user in pack),
+                                             "fields": "screen_name"}, token=self.token)
+
+    def _execute_tasks(self, template, tasks, *, convert=None):
         """
-        Users who liked posts.
-        :return: lists of posts and likers
+        Running tasks in packs of 25 from several threads. Only a few packs are downloaded ahead, so results are
+        not kept in memory.
+        :param template: VKScript code with {wall} and {tasks}
+        :param tasks: list of lists with parameters
+        :param convert: function making a smaller result of a task, it is called in the threads
+        :return: iterator over (task, result) tuples
         """
-        plist = self.posts_list()
-        id_list_orig = [data["id"] for data in plist]
-        id_list = id_list_orig.copy()
-        result = []
+        packs = (tasks[offset:offset + 25] for offset in range(0, len(tasks), 25))
+        total = -(-len(tasks) // 25)
+
+        def run(pack):
+            code = template.format(wall=self.wall, tasks=",".join(json.dumps(task) for task in pack))
+            data = call_api("execute", params={"code": code}, token=self.token, version=COMMENTS_API_VER)
+            return [convert(result) for result in data] if convert else data
 
-        twenty_five_range = len(id_list) // 25
-        twenty_five_out = len(id_list) % 25
-        tens_range = twenty_five_out // 10
-        tens_out = twenty_five_out % 10
         progress = 0
-        did = 0
-        task = list(range(len(id_list)))
+        with ThreadPoolExecutor(max_workers=self.threads) as executor:
+            pending = deque((pack, executor.submit(run, pack)) for pack in itertools.islice(packs, self.threads * 2))
+            did = 0
+            while pending:
+                pack, future = pending.popleft()
+                data = future.result()
+                for next_pack in itertools.islice(packs, 1):
+                    pending.append((next_pack, executor.submit(run, next_pack)))
+                did += 1
+                cur_progress = did * 100 // total
+                if cur_progress > progress:
+                    progress = cur_progress
+                    log_write(_("Getting comments: {}%").format(cur_progress))
+                for task, result in zip(pack, data):
+                    yield task, result
+
+    @staticmethod
+    def _thread_authors(data):
+        """
+        Keeping only authors of replies in a page of comments, texts and attachments are dropped.
+        :param data: result of COMMENTS_CODE for a task
+        :return: the same result with threads as {"count": number, "from": list of IDs}
+        """
+        if data:
+            data["threads"] = [thread and {"count": thread["count"],
+                                           "from": [item["from_id"] for item in thread.get("items", [])]}
+                               for thread in data["threads"] or []]
+        return data
 
-        for i in range(twenty_five_range):
-            cur_progress = percents(did, task)
-            if cur_progress > progress:
-                progress = cur_progress
-                log_write(_("Getting likers: {}%").format(cur_progress))
-            count = [id_list.pop() for os._ in range(25)]
-            data = call_api("execute.likesGetBigList",
-                            params={"wall": self.wall, "posts": ("{}," * 25)[:-1].format(*count)}, token=self.token)
+    def iter_comments(self, plist):
+        """
+        Authors of comments and replies, by pages.
+        :param plist: result of posts_list()
+        :return: iterator over (post ID, list of authors' IDs) tuples
+        """
+        tasks = [[post["id"], 0] for post in plist if post["comments"]]
+        replies = []
+        while tasks:
+            pages = []
+            for (post, offset), data in self._execute_tasks(COMMENTS_CODE, tasks, convert=self._thread_authors):
+                if not data:
+                    continue
+                yield post, data["from"] or []
+                for comment, thread in zip(data["ids"] or [], data["threads"]):
+                    if not thread:
+                        continue
+                    yield post, thread["from"]
+                    replies.extend([post, comment, rest] for rest in range(len(thread["from"]), thread["count"], 100))
+                if not offset:  # other pages are known after the first one
+                    pages.extend([post, rest] for rest in range(100, data["count"] or 0, 100))
+            tasks = pages
+        for (post, comment, offset), data in self._execute_tasks(REPLIES_CODE, replies):
             if data:
-                result.extend(data)
-            did += 25
+                yield post, data["from"] or []
 
-        for i in range(tens_range):
-            cur_progress = percents(did, task)
-            if cur_progress > progress:
-                progress = cur_progress
-                log_write(_("Getting likers: {}%").format(cur_progress))
-            count = [id_list.pop() for os._ in range(10)]
-            data = call_api("execute.likesGetBigList",
-                            params={"wall": self.wall, "posts": ("{}," * 10)[:-1].format(*count)}, token=self.token)
-            if data:
-                result.extend(data)
-            did += 10
+    @staticmethod
+    def _run_stage(name, results, events, slots, stop):
+        """
+        Running a stage of the pipeline in a thread.
+        :param name: name of the stage
+        :param results: iterator which downloads data
+        :param events: queue for (name, result), ("end", name) and ("error", exception) tuples
+        :param slots: semaphore limiting results which are waiting for processing
+        :param stop: event for stopping the stage
+        """
+        try:
+            for result in results:
+                while not slots.acquire(timeout=0.1):
+                    if stop.is_set():
+                        return
+                if stop.is_set():
+                    return
+                events.put((name, result))
+        except Exception as err:
+            events.put(("error", err))
+        finally:
+            events.put(("end", name))
+
+    def gather_modes(self, modes):
+        """
+        Gathering statistics for several modes at once, every kind of data is fetched only once.
+        Posts, likers and users are downloaded by pipelined stages, so likers of the first posts and information
+        about the first users are downloaded while the wall is still being read. Data is counted and saved to
+        the store in this thread only. Posts are kept as columns of integers. With the limit for memory users are
+        not downloaded early, because their information would be kept in memory: counts are streamed from
+        the modes and users are downloaded by packs at the end. Packs of posts wait while likes_backlog posts
+        wait for likers, so the wall isn't read much faster than likers are downloaded.
+        :param modes: list of StatsMode instances
+        :return: dictionary {mode name: list of tuples with user's information and count}
+        """
+        needs = set().union(*(mode.needs for mode in modes))
+        owner = int(self.wall)
+        author_filters = {mode.wall_filter for mode in modes if type(mode).add_post is not StatsMode.add_post}
+        early_users = not self.memory_limit
+        columns = {key: array("q") for key in ("id", "from_id", "likes", "comments", "reposts")}
+        liking = {}  # post ID: post, for posts whose likers are being downloaded
+        users = {}
+        seen = set()  # users sent to the users stage
+        waiting = {"likes": [], "users": []}  # posts and users for the next packs of the stages
+        tasks = {"likes": Queue(maxsize=(self.likes_backlog + self.posts_pack) // 25 + 2), "users": Queue()}
+        deferred = []  # packs of posts waiting for likers of earlier posts, their slots aren't released
+        posts_done = [False]
+        events = Queue()
+        slots = {}
+        running = set()
+        stop = threading.Event()
+        enough = threading.Event()  # the limit for date is reached
+        liked = [0]
+
+        def start(name, results, stage_stop=stop):
+            slots[name] = threading.Semaphore(self.pipeline_size)
+            running.add(name)
+            threading.Thread(target=self._run_stage, args=(name, results, events, slots[name], stage_stop),
+                             daemon=True).start()
+
+        def send(name, items, size, final=False):
+            pack = waiting[name]
+            pack.extend(items)
+            while len(pack) >= size or (final and pack):
+                tasks[name].put(pack[:size])
+                del pack[:size]
+            if final:
+                tasks[name].put(None)
+
+        def add_users(ids):
+            if not early_users:
+                return
+            new = []
+            for uid in ids:
+                if uid not in seen:
+                    seen.add(uid)
+                    new.append(uid)
+            send("users", new, 1000)
+
+        def fan_out(post, method, *data):
+            for mode in modes:
+                if mode.wall_filter == "all" or post["data"][0] != owner:
+                    getattr(mode, method)(post, *data)
+
+        def add_posts(result):
+            if enough.is_set():
+                return
+            pack, reached = self._post_rows(result)
+            if reached:
+                enough.set()
+            for post in pack:
+                for key in ("id", "comments", "reposts"):
+                    columns[key].append(post[key])
+                columns["from_id"].append(post["data"][0])
+                columns["likes"].append(post["data"][1])
+                fan_out(post, "add_post")
+            if author_filters:  # authors are counted
+                add_users(post["data"][0] for post in pack
+                          if "all" in author_filters or post["data"][0] != owner)
+            if "likes" in needs:
+                post_ids = []
+                for post in pack:
+                    if post["data"][1] and post["id"] not in liking:  # live walls repeat posts on pages
+                        liking[post["id"]] = post
+                        post_ids.append(post["id"])
+                send("likes", post_ids, 25)
+
+        def handle(event):
+            name, result = event
+            if name == "error":
+                raise result
+            if name == "end":
+                running.discard(result)
+                if result == "posts" and "likes" in needs:
+                    if deferred:  # the last packs are counted later
+                        posts_done[0] = True
+                    else:
+                        send("likes", [], 25, final=True)
+                return
+            if name == "posts" and "likes" in needs and len(liking) >= self.likes_backlog:
+                deferred.append(result)
+                return
+            slots[name].release()
+            if name == "posts":
+                add_posts(result)
+            elif name == "likes":
+                if self.store:
+                    self.store.add_likes(result)
+                for post_id, likers in result.items():
+                    fan_out(liking.pop(post_id), "add_likes", likers)
+                    add_users(likers)
+                liked[0] += len(result)
+                if liked[0] % 1000 < len(result):
+                    log_write(_("Got likers of {} posts").format(liked[0]))
+                while deferred and len(liking) < self.likes_backlog:
+                    slots["posts"].release()
+                    add_posts(deferred.pop(0))
+                if posts_done[0] and not deferred:
+                    send("likes", [], 25, final=True)
+                    posts_done[0] = False
+            elif name == "users":
+                if self.store:
+                    self.store.add_users(result)
+                for user in result:
+                    users[user["id"]] = user
 
-        for i in range(tens_out):
-            item = id_list.pop()
-            cur_progress = percents(did, task)
-            if cur_progress > progress:
-                progress = cur_progress
-                log_write(_("Getting likers: {}%").format(cur_progress))
-            data = call_api("likes.getList", params={"type": "post", "owner_id": self.wall,
-                                                     "item_id": item, "count": 1000},
-                            token=self.token)["items"]
-            if data:
-                result.extend(data)
-            did += 1
-        return id_list_orig, result
+        try:
+            start("posts", self._fetch_post_packs(), enough)
+            if "likes" in needs:
+                start("likes", map(self._get_likes_pack, iter(tasks["likes"].get, None)))
+            if early_users:
+                start("users", map(self._get_users_pack, iter(tasks["users"].get, None)))
+            while running - {"users"}:
+                handle(events.get())
+            if "comments" in needs:
+                positions = array("q", sorted(range(len(columns["id"])), key=columns["id"].__getitem__))
+                ids = array("q", (columns["id"][position] for position in positions))  # for searching posts
+                plist = ({"id": post_id, "comments": comments}
+                         for post_id, comments in zip(columns["id"], columns["comments"]))
+                for post_id, from_ids in self.iter_comments(plist):
+                    position = positions[bisect.bisect_left(ids, post_id)]
+                    post = {"data": (columns["from_id"][position], columns["likes"][position]), "id": post_id,
+                            "comments": columns["comments"][position], "reposts": columns["reposts"][position]}
+                    fan_out(post, "add_comments", from_ids)
+                    add_users(uid for uid in from_ids if uid > 0)
+                    while not events.empty():
+                        handle(events.get())
+            if early_users:
+                send("users", [], 1000, final=True)
+            while running:
+                handle(events.get())
+        finally:
+            stop.set()
+            enough.set()
+            for stage_tasks in tasks.values():
+                try:
+                    stage_tasks.put_nowait(None)
+                except Full:  # the stage isn't waiting for tasks, it is stopped by the event
+                    pass
+        columns.clear()
+        seen.clear()
+        return {mode.name: self.counted_users(mode.counts(), known=users) for mode in modes}
+
+    def counted_users(self, counts, *, known=None):
+        """
+        Getting information about counted users by packs, so counts are not kept in memory twice.
+        :param counts: iterator over (user ID, count) tuples
+        :param known: dictionary {user ID: information} of already downloaded users
+        :return: list of tuples with user's information and count
+        """
+        known = known or {}
+        result = []
+        for pack in iter(lambda: list(itertools.islice(counts, 1000)), []):
+            found = {uid: known[uid] for uid, count in pack if uid in known}
+            missing = [uid for uid, count in pack if uid not in known]
+            if missing:  # users counted by plugins from other data or without early downloading
+                found.update((user["id"], user) for user in self.users(missing))
+            for uid, count in pack:
+                user = found.get(uid)
+                if user is None:
+                    continue
+                if "deactivated" in user:  # if user is deleted or banned
+                    user["screen_name"] = user["deactivated"].upper()
+                result.append((count, user))
+        return result
 
     def gather_stats(self):
         """
-        Gathering statistics [POSTS].
-        :return: tuple with user's information and count of posts
+        Gathering statistics for the mode of the class.
+        :return: list of tuples with user's information and count
         """
-        plist = self.posts_list()
-        progress = 0
+        mode = MODES[self.mode_name](memory_limit=self.memory_limit)
+        return self.gather_modes([mode])[mode.name]
+
+    def gather_sketch(self):
+        """
+        Gathering approximate statistics [POSTS].
+        :return: AudienceSketch
+        """
+        sketch = AudienceSketch(self.sketch_size)
+        for posts in self.iter_posts():
+            for post in posts:
+                sketch.add(post["data"][0])
+        return sketch
 
-        from_ids = [uid["data"][0] for uid in plist]
-        from_ids_unique = list({uid for uid in from_ids})
-        from_list = []
-        data = self.users(from_ids_unique)
+    def approximate_stats(self, mode):
+        """
+        Gathering approximate statistics and saving the sketch with error bounds for merging.
+        :param mode: prefix for file
+        :return: list of tuples with user's information and estimated count
+        """
+        sketch = self.gather_sketch()
+        summary = sketch.summary()
+        log_write(_("About {} users (error {:.1%}), counts are higher by {} at most").format(
+            summary["distinct"]["estimate"], summary["distinct"]["relative_error"], summary["max_error"]))
+        path = "{}/sketch_{}_{}.json".format(results_dir(), mode, self.screen_name)
+        write_atomic(path, lambda file: json.dump({"summary": summary, "sketch": sketch.to_dict()}, file))
+        log_write(_("Exported to: {}").format(path))
+        return self.counted_users(iter([(user, count) for user, count, low, high in sketch.top()]))
+
+    def sample_pages(self):
+        """
+        Getting a random sample of pages of the wall.
+        :return: list of pages, every page is a list of (post ID, from_id, likes) tuples
+        """
+        pages_total = -(-self.posts_lim // 100)
+        offsets = sorted(random.sample(range(pages_total), min(max(2, round(pages_total * self.sample)),
+                                                              pages_total)))
+        log_write(_("Sampled {} of {} pages").format(len(offsets), pages_total))
+        pages = []
+        for start in range(0, len(offsets), 25):
+            pack = offsets[start:start + 25]
+            code = SAMPLE_POSTS_CODE.format(wall=self.wall, filter=self.filter,
+                                            offsets=",".join(str(offset * 100) for offset in pack))
+            for data in call_api("execute", params={"code": code}, token=self.token):
+                dates = data["date"] or []
+                pages.append([(post, from_id, likes["count"])
+                              for post, from_id, likes, date in zip(data["id"] or [], data["from_id"] or [],
+                                                                    data["likes"] or [], dates)
+                              if not self.date_lim or date >= self.date_lim])
+        return pages, pages_total
+
+    def sample_page_counts(self, pages):
+        """
+        Counting activity on sampled pages [POSTS].
+        :param pages: result of sample_pages()
+        :return: list of collections.Counter {user ID: count}
+        """
+        return [Counter(from_id for post, from_id, likes in page) for page in pages]
 
+    def sample_stats(self, mode):
+        """
+        Estimating statistics from a random sample of pages and saving confidence intervals.
+        :param mode: prefix for file
+        :return: list of tuples with user's information and estimated count
+        """
+        pages, pages_total = self.sample_pages()
+        estimates = sample_estimates(self.sample_page_counts(pages), pages_total)
+        reliable = 0
+        while reliable < len(estimates) and estimates[reliable]["reliable"]:
+            reliable += 1
+        log_write(_("The first {} places of the rating are reliable").format(reliable))
+        path = "{}/sample_{}_{}.json".format(results_dir(), mode, self.screen_name)
+        write_atomic(path, lambda file: json.dump({"pages": pages_total, "sampled": len(pages),
+                                                   "confidence": 0.95, "rating": estimates}, file))
+        log_write(_("Exported to: {}").format(path))
+        return self.counted_users(iter([(row["id"], round(row["estimate"])) for row in estimates]))
+
+    def _export(self, data, mode, exports):
         for user in data:
-            if "deactivated" in user:  # if user is deleted or banned
-                user["screen_name"] = user["deactivated"].upper()
-            posts_from_user = from_ids.count(user["id"])
-            cur_progress = percents(user, data)
-            if cur_progress > progress:
-                progress = cur_progress
-                log_write(_("Processing user: {}%").format(cur_progress))
-            from_list.append((posts_from_user, user))
-        return from_list
+            user[1].setdefault("screen_name", "id{}".format(user[1]["id"]))
+        return export(ranking(data), mode=mode, name=self.screen_name, exports=exports)
 
-    def stats(self, mode="posts"):
+    def stats(self, mode=None, exports=DEFAULT_EXPORTS):
         """
         Exporting statistics.
-        :param mode: prefix for file
+        :param mode: prefix for file [prefix of the mode of the class]
+        :param exports: formats from EXPORTERS
+        :return: list of exported files
+        """
+        mode = mode or MODES[self.mode_name].prefix
+        if self.sample:
+            data = self.sample_stats(mode)
+        elif self.approximate:
+            data = self.approximate_stats(mode)
+        else:
+            data = self.gather_stats()
+        paths = self._export(data, mode, exports)
+        if not console:
+            success_win.show_all()
+        return paths
+
+    def stats_modes(self, modes, exports=DEFAULT_EXPORTS):
         """
-        data = self.gather_stats()
-        res_txt = "{}_{}.txt".format(mode, self.screen_name)
-        res_csv = "{}_{}.csv".format(mode, self.screen_name)
-        log_write(_("Exporting to: {}/results/{} & csv").format(CURDIR, res_txt))
-        if res_txt in os.listdir("{}/results".format(CURDIR)):
-            os.remove("{}/results/{}".format(CURDIR, res_txt))
-        if res_csv in os.listdir("{}/results".format(CURDIR)):
-            os.remove("{}/results/{}".format(CURDIR, res_csv))
-        txt_file = open("{}/results/{}".format(CURDIR, res_txt), mode="a")
-        csv_file = open("{}/results/{}".format(CURDIR, res_csv), mode="w", newline="")
-        writer = csv.writer(csv_file)
-        rows = [["URL", _("Name"), _("Count")]]
-        print(_("STATISTICS FOR {}").format(mode.upper()), file=txt_file)
-        while data:
-            max_object = max(data, key=lambda sequence: sequence[0])
-            max_index = data.index(max_object)
-            max_count = max_object[0]
-            user_data = data.pop(max_index)[1]
-            user_string = "https://vk.com/{screen_name} ({first_name} {last_name}): {0}".format(max_count, **user_data)
-            print(user_string, file=txt_file)
-            rows.append(["https://vk.com/{screen_name}".format(**user_data),
-                         "{first_name} {last_name}".format(**user_data),
-                         max_count])
-        writer.writerows(rows)
-        success_win.show_all()
+        Exporting statistics for several modes gathered at once.
+        :param modes: list of StatsMode instances
+        :param exports: formats from EXPORTERS
+        :return: list of exported files
+        """
+        results = self.gather_modes(modes)
+        paths = []
+        for mode in modes:
+            paths.extend(self._export(results[mode.name], mode.prefix, exports))
+        if not console:
+            success_win.show_all()
+        return paths
 
 
 class LikedStats(Stats):
     """
     Gather, make and export statistics for liked posts
     """
+    mode_name = "liked"
 
-    def gather_stats(self):
+    def sample_page_counts(self, pages):
         """
-        Gathering statistics for liked posts.
-        :return: dictionary with user's information and general count of likes
+        Counting collected likes on sampled pages.
+        :param pages: result of sample_pages()
+        :return: list of collections.Counter {user ID: count}
         """
-        plist = self.posts_list()
-        progress = 0
-
-        data = [val["data"] for val in plist]
-        users = {val[0]: 0 for val in data}
         result = []
-        for user, likes in data:
-            users[user] += likes
-        items_list = list(users.items())
-        users_list = [key[0] for key in items_list]
-        likes_list = [key[1] for key in items_list]
-
-        users_data = self.users(users_list)
-        for user, likes in zip(users_data, likes_list):
-            if "deactivated" in user:
-                user["screen_name"] = user["deactivated"].upper()
-            cur_progress = percents(likes, likes_list)
-            if cur_progress > progress:
-                progress = cur_progress
-                log_write(_("Processing user: {}%").format(cur_progress))
-            result.append((likes, user))
+        for page in pages:
+            counts = Counter()
+            for post, from_id, likes in page:
+                counts[from_id] += likes
+            result.append(counts)
         return result
 
-    def stats(self, **kwargs):
+    def gather_sketch(self):
         """
-        Exporting statistics for likes
-        :param kwargs: for compatibility
+        Gathering approximate statistics for liked posts.
+        :return: AudienceSketch
         """
-        Stats.stats(self, mode="likes")
+        sketch = AudienceSketch(self.sketch_size)
+        for posts in self.iter_posts():
+            for post in posts:
+                from_id, likes = post["data"]
+                if likes:
+                    sketch.add(from_id, likes)
+        return sketch
 
 
 class LikersStats(Stats):
     """
     Gather, make and export statistics for likers
     """
+    mode_name = "likers"
 
-    def gather_stats(self):
+    def sample_page_counts(self, pages):
         """
-        Gathering statistics for likers.
-        :return: dictionary with user's information and general count of likes
+        Counting done likes on sampled pages.
+        :param pages: result of sample_pages()
+        :return: list of collections.Counter {user ID: count}
         """
-        likers_data = self.likers()
-        likers = likers_data[1]
-        likers_unique = list({uid for uid in likers})
+        post_ids = [post for page in pages for post, from_id, count in page if count]
+        likes = {}
+        for offset in range(0, len(post_ids), 25):  # not saved to the store, posts of samples aren't there
+            likes.update(self._get_likes_pack(post_ids[offset:offset + 25]))
         result = []
-        progress = 0
-        did = 0
-        task = list(range(len(likers_unique)))
-
-        users_data = self.users(likers_unique)
-
-        for liker in users_data:
-            cur_progress = percents(did, task)
-            count = likers.count(liker["id"])
-            if "deactivated" in liker:
-                liker["screen_name"] = liker["deactivated"].upper()
-            if cur_progress > progress:
-                progress = cur_progress
-                log_write(_("Processing user: {}%").format(cur_progress))
-            result.append((count, liker))
-            did += 1
+        for page in pages:
+            counts = Counter()
+            for post, from_id, count in page:
+                counts.update(likes.get(post, []))
+            result.append(counts)
         return result
 
-    def stats(self, **kwargs):
+    def gather_sketch(self):
         """
-        Exporting statistics for likers
-        :param kwargs: for compatibility.
+        Gathering approximate statistics for likers.
+        :return: AudienceSketch
         """
-        Stats.stats(self, mode="likers")
+        sketch = AudienceSketch(self.sketch_size)
+        liked = 0
+        for posts in self.iter_posts():  # likers of a pack of posts before the next one
+            post_ids = [post["id"] for post in posts if post["data"][1]]
+            for offset in range(0, len(post_ids), 25):
+                pack = self._get_likes_pack(post_ids[offset:offset + 25])
+                if self.store:
+                    self.store.add_likes(pack)
+                for likers in pack.values():
+                    for liker in likers:
+                        sketch.add(liker)
+            liked += len(post_ids)
+            log_write(_("Got likers of {} posts").format(liked))
+        return sketch
+
+
+class CommentersStats(Stats):
+    """
+    Gather, make and export statistics for commenters
+    """
+    mode_name = "commenters"
 
 
-if __name__ == "__main__":
-    args = parse_cmd_args()
-    if args["update"]:
-        upd_check()
+class CommentedStats(Stats):
+    """
+    Gather, make and export statistics for commented posts
+    """
+    mode_name = "commented"
 
-    if "token.txt" not in os.listdir(HOME) or args["login"]:
-        access_token = login()
-    else:
-        access_token = open("{}/token.txt".format(HOME)).read()
 
-    call_api(method="stats.trackVisitor", params={}, token=access_token)  # needed for stats gathering
+def load_token():
+    """
+    Reading access_token saved by login.
+    :return: access_token or None
+    """
+    path = "{}/token.txt".format(HOME)
+    if not os.path.exists(path):
+        return None
+    with open(path) as token_file:
+        return token_file.read().split(",")[0].strip()  # the GUI also saves ID of the user
+
+
+ESTIMATING_STATS = {"posts": Stats, "liked": LikedStats, "likers": LikersStats}  # modes with approximate stats
+
+
+def mode_names(args):
+    """
+    Modes of stats from arguments, jobs of old versions have only one mode.
+    :param args: parsed command-line arguments (dict)
+    :return: list of names from MODES
+    """
+    names = [args["mode"]] if isinstance(args["mode"], str) else args["mode"]
+    for name in names:
+        if name not in MODES:
+            raise ValueError(_("Unknown mode: {}").format(name))
+    return list(OrderedDict.fromkeys(names))
+
+
+def open_stats(args, token, *, modes, stats_class=Stats):
+    """
+    Making statistics object for a wall.
+    :param args: parsed command-line arguments (dict)
+    :param token: access_token
+    :param modes: list of StatsMode instances, posts are filtered for them
+    :param stats_class: Stats or its subclass
+    :return: Stats instance and CrawlStore (or None)
+    """
+    call_api(method="stats.trackVisitor", params={}, token=token)  # needed for stats gathering
 
     wall_data = call_api("utils.resolveScreenName", params={"screen_name": args["wall"].split("/")[-1]},
-                         token=access_token)
+                         token=token)
+    if not wall_data:  # VK returns an empty list for unknown names
+        raise WallNotFoundError(_("Wall '{}' is not found").format(args["wall"]))
     wall_type = wall_data["type"]
     obj_id = wall_data["object_id"]
 
     if wall_type == "group":
-        group_data = call_api(method="groups.getById", params={"group_ids": obj_id}, token=access_token)[0]
+        group_data = call_api(method="groups.getById", params={"group_ids": obj_id}, token=token)[0]
         screen_name = group_data["screen_name"]
         title = group_data["name"]
     else:
         profile = call_api(method="users.get", params={"user_ids": obj_id, "fields": "screen_name"},
-                           token=access_token)[0]
+                           token=token)[0]
         screen_name = profile["screen_name"]
         title = "{first_name} {last_name}".format(**profile)
 
     log_write(_("STARTED GATHERING STATS FROM '{}'").format(title.upper()))
 
-    if args["mode"] == "posts":
-        stats = Stats(screen_name, token=access_token, posts_lim=args["posts"], date_lim=args["date"])
-    elif args["mode"] == "liked":
-        stats = LikedStats(screen_name, token=access_token, posts_lim=args["posts"], date_lim=args["date"])
-    else:
-        stats = LikersStats(screen_name, token=access_token, posts_lim=args["posts"],
-                            date_lim=args["date"], wall_filter="all")
+    store = None if args["no_store"] else CrawlStore.for_wall(screen_name)
+    wall_filter = "all" if any(mode.wall_filter == "all" for mode in modes) else "others"
+    stats = stats_class(screen_name, token=token, posts_lim=args["posts"], date_lim=args["date"],
+                        wall_filter=wall_filter, store=store, threads=args.get("threads", 4),
+                        memory_limit=args.get("memory_limit", 0), approximate=args.get("approximate", False),
+                        sketch_size=args.get("sketch_size", 1000), sample=args.get("sample", 0))
+    return stats, store
+
+
+def gather(args, token):
+    """
+    Gathering and exporting statistics.
+    :param args: parsed command-line arguments (dict)
+    :param token: access_token
+    :return: list of exported files
+    """
+    modes = [MODES[name](memory_limit=args.get("memory_limit", 0)) for name in mode_names(args)]
+    exports = sorted(EXPORTERS) if "all" in args["export"] else args["export"]
+    paths = []
+    if args.get("approximate") or args.get("sample"):  # estimating modes are gathered separately, others exactly
+        estimating_args = dict(args, no_store=True) if args.get("sample") else args  # samples aren't crawled data
+        for mode in [mode for mode in modes if mode.name in ESTIMATING_STATS]:
+            stats, store = open_stats(estimating_args, token, modes=[mode], stats_class=ESTIMATING_STATS[mode.name])
+            try:
+                paths.extend(stats.stats(exports=exports))
+            finally:
+                if store:
+                    store.close()
+        modes = [mode for mode in modes if mode.name not in ESTIMATING_STATS]
+    if modes:
+        stats, store = open_stats(args, token, modes=modes)
+        try:
+            paths.extend(stats.stats_modes(modes, exports=exports))
+            if store:
+                log_write(_("Updated the daily index for {} days").format(store.update_daily()))
+                if any("likes" in mode.needs for mode in modes):
+                    store.like_index().close()
+        finally:
+            if store:
+                store.close()
+    return paths
+
+
+def main(args):
+    """
+    Gathering statistics from the command line.
+    :param args: parsed command-line arguments (dict)
+    """
+    if args["update"]:
+        upd_check()
+
+    access_token = load_token()
+    if access_token is None or args["login"]:
+        access_token = login()
+
+    gather(args, access_token)
 
-    stats.stats()
+    log_write(_("SUCCESSFUL!"))
+
+
+def open_store(args):
+    """
+    Opening crawled data for commands working without VK.
+    :param args: parsed command-line arguments with "wall", "date" and "until"
+    :return: CrawlStore, name of the wall, the earliest and the latest dates
+    """
+    name = args["wall"].split("/")[-1]
+    path = "{}/crawl_{}.sqlite".format(results_dir(), name)
+    if not os.path.exists(path):
+        print(_("No crawled data for '{}'. Gather stats at first.").format(name), file=sys.stderr)
+        sys.exit(1)
+    try:
+        since = parse_date(args["date"])
+        until = parse_date(args["until"])
+    except ValueError as err:
+        print(err, file=sys.stderr)
+        sys.exit(1)
+    if until:
+        until += 24 * 60 * 60 - 1  # including the whole day
+    return CrawlStore(path), name, since, until
+
+
+def query(args):
+    """
+    Computing statistics from crawled data.
+    :param args: parsed command-line arguments (dict)
+    """
+    store, name, since, until = open_store(args)
+    data = store.ranking(args["mode"], since=since, until=until, top=args["top"])
+    store.close()
+    exports = sorted(EXPORTERS) if "all" in args["export"] else args["export"]
+    mode = {"posts": "posts", "liked": "likes", "likers": "likers"}[args["mode"]]
+    export(iter(data), mode=mode, name=name, exports=exports)
+    log_write(_("SUCCESSFUL!"))
+
+
+def timeline(args):
+    """
+    Computing activity over time from crawled data.
+    :param args: parsed command-line arguments (dict)
+    """
+    store, name, since, until = open_store(args)
+    offset = int(args["tz"] * 3600)
+    from_ids, dates = store.post_dates(since=since, until=until)
+    like_dates, like_counts = store.like_dates(since=since, until=until)
+    store.close()
+    log_write(_("Processing {} posts...").format(len(dates)))
+
+    summary = {"posts": activity_summary(*bin_dates(dates, offset=offset)),
+               "likes": activity_summary(*bin_dates(like_dates, offset=offset, weights=like_counts))}
+    user_days = Counter(zip(from_ids, ((ts + offset) // 86400 for ts in dates)))
+    users = Counter()
+    for (user, day), count in user_days.items():
+        users[user] += count
+    if args["top"]:
+        top_users = {user for user, count in users.most_common(args["top"])}
+        user_days = {key: count for key, count in user_days.items() if key[0] in top_users}
+    user_rows = sorted(user_days.items())
+
+    res_dir = results_dir()
+    paths = []
+    if "csv" in args["format"]:
+        for kind in ("posts", "likes"):
+            def write_heatmap(file, heatmap=summary[kind]["heatmap"]):
+                writer = csv.writer(file)
+                writer.writerow([""] + list(range(24)))
+                writer.writerows([day] + heatmap[day] for day in WEEKDAYS)
+            paths.append("{}/heatmap_{}_{}.csv".format(res_dir, kind, name))
+            write_atomic(paths[-1], write_heatmap)
+
+        def write_users(file):
+            writer = csv.writer(file)
+            writer.writerow(["ID", _("Date"), _("Count")])
+            writer.writerows((user, day_name(day), count) for (user, day), count in user_rows)
+        paths.append("{}/timeline_users_{}.csv".format(res_dir, name))
+        write_atomic(paths[-1], write_users)
+    if "json" in args["format"]:
+        user_timelines = {}
+        for (user, day), count in user_rows:
+            user_timelines.setdefault(str(user), {})[day_name(day)] = count
+        summary["users"] = user_timelines
+        paths.append("{}/timeline_{}.json".format(res_dir, name))
+        write_atomic(paths[-1], lambda file: json.dump(summary, file, ensure_ascii=False))
+    for path in paths:
+        log_write(_("Exported to: {}").format(path))
+    log_write(_("SUCCESSFUL!"))
 
+
+def overlap(args):
+    """
+    Computing overlap of audiences of crawled walls.
+    :param args: parsed command-line arguments (dict)
+    """
+    res_dir = results_dir()
+    names = [wall.split("/")[-1] for wall in args["walls"]]
+    if not names:
+        names = sorted(name[len("crawl_"):-len(".sqlite")] for name in os.listdir(res_dir)
+                       if name.startswith("crawl_") and name.endswith(".sqlite"))
+    engine = AudienceOverlap()
+    for name in names:
+        store, name, since, until = open_store(dict(args, wall=name))
+        engine.add(name, store.audience(args["audience"], since=since, until=until))
+        store.close()
+    log_write(_("Users in {} walls: {}").format(len(names), engine.build()))
+    inter, jaccard = engine.matrices()
+
+    for kind, matrix in (("intersection", inter), ("jaccard", jaccard)):
+        def write_matrix(file, matrix=matrix):
+            writer = csv.writer(file)
+            writer.writerow([""] + names)
+            writer.writerows([name] + row for name, row in zip(names, matrix))
+        path = "{}/overlap_{}_{}.csv".format(res_dir, kind, args["audience"])
+        write_atomic(path, write_matrix)
+        log_write(_("Exported to: {}").format(path))
+    log_write(_("SUCCESSFUL!"))
+
+
+def likes(args):
+    """
+    Showing likes of users and likers of posts from the index of crawled likes.
+    :param args: parsed command-line arguments (dict)
+    """
+    store, name, since, until = open_store(dict(args, date="0/0/0", until="0/0/0"))
+    index = store.like_index()
+    try:
+        if args["post"]:
+            users = index.common_likers(args["post"])
+            info = store.users(users)
+            for uid in users:
+                print(uid, info[uid]["screen_name"], info[uid]["first_name"], info[uid]["last_name"], sep="\t")
+        elif len(args["user"]) == 1:
+            for date, post in index.history(args["user"][0]):
+                print(time.strftime("%Y-%m-%d %H:%M", time.localtime(date)), post, sep="\t")
+        else:
+            for post in index.common_liked(args["user"]):
+                print(post)
+    finally:
+        index.close()
+        store.close()
+
+
+def rings(args):
+    """
+    Finding groups of accounts with abnormally high overlap of liked posts.
+    :param args: parsed command-line arguments (dict)
+    """
+    store, name, since, until = open_store(dict(args, date="0/0/0", until="0/0/0"))
+    index = store.like_index()
+    try:
+        graph = CoLikeGraph(index, top=args["top"], max_likers=args["max_likers"])
+        log_write(_("Comparing {} likers by {} posts...").format(len(graph.users), len(graph.post_likers)))
+        pairs = list(graph.pairs(min_common=args["min_common"], min_jaccard=args["min_similarity"]))
+    finally:
+        index.close()
+    groups = CoLikeGraph.clusters(pairs)
+    degrees = dict(zip(graph.users, graph.degrees))
+    users = store.users([user for group in groups for user in group])
+    store.close()
+    log_write(_("Found {} groups of {} accounts").format(len(groups), len(users)))
+
+    def write_groups(file):
+        writer = csv.writer(file)
+        writer.writerow([_("Group"), _("Size"), "ID", _("Screen name"), _("Name"), _("Likes")])
+        for number, group in enumerate(groups, 1):
+            writer.writerows([number, len(group), user, users[user]["screen_name"],
+                              "{first_name} {last_name}".format(**users[user]), degrees[user]] for user in group)
+
+    def write_pairs(file):
+        writer = csv.writer(file)
+        writer.writerow(["ID", "ID", _("Common likes"), "Jaccard"])
+        writer.writerows(sorted(pairs, key=lambda pair: (-pair[3], -pair[2])))
+
+    for kind, write in (("rings", write_groups), ("rings_pairs", write_pairs)):
+        path = "{}/{}_{}.csv".format(results_dir(), kind, name)
+        write_atomic(path, write)
+        log_write(_("Exported to: {}").format(path))
     log_write(_("SUCCESSFUL!"))
+
+
+def open_queue(args):
+    """
+    Opening the queue of jobs.
+    :param args: parsed command-line arguments with "queue"
+    :return: JobQueue, or SpoolQueue for a directory
+    """
+    path = args["queue"] or "{}/queue.sqlite".format(results_dir())
+    if os.path.isdir(path) or path.endswith(os.sep):
+        return SpoolQueue(path)
+    return JobQueue(path)
+
+
+def submit(args):
+    """
+    Adding crawl jobs.
+    :param args: parsed command-line arguments (dict)
+    """
+    try:
+        parse_date(args["date"])
+    except ValueError as err:
+        print(err, file=sys.stderr)
+        sys.exit(1)
+    queue = open_queue(args)
+    job_args = {key: args[key] for key in ("mode", "threads", "posts", "date", "export", "no_store")}
+    for wall in args["walls"]:
+        job = queue.submit(dict(job_args, wall=wall), max_attempts=args["attempts"])
+        log_write(_("Added job {} for '{}'").format(job, wall))
+    queue.close()
+
+
+def worker(args):
+    """
+    Running crawl jobs from the queue until it's empty (with --once) or forever.
+    :param args: parsed command-line arguments (dict)
+    """
+    token = load_token()
+    if token is None:
+        print(_("Log in at first: no token.txt in the home directory"), file=sys.stderr)
+        sys.exit(1)
+    name = "{}:{}".format(socket.gethostname(), os.getpid())
+    queue = open_queue(args)
+    log_write(_("Worker {} started").format(name))
+
+    while True:
+        claimed = queue.claim(name, lease=args["lease"])
+        if claimed is None:
+            if args["once"]:
+                break
+            time.sleep(args["poll"])
+            continue
+        job, job_args = claimed
+        log_write(_("Running job {} for '{}'").format(job, job_args["wall"]))
+
+        stop = threading.Event()
+
+        def beat(job=job):
+            beat_queue = type(queue)(queue.path)  # SQLite connections can't be shared by threads
+            while not stop.wait(args["lease"] / 3):
+                if not beat_queue.heartbeat(job, name, lease=args["lease"]):
+                    log_write(_("Lost the lease for job {}").format(job), to=sys.stderr)
+            beat_queue.close()
+
+        heart = threading.Thread(target=beat, daemon=True)
+        heart.start()
+        try:
+            paths = gather(job_args, token)
+        except ValueError as err:  # wrong date or unknown wall, other attempts will fail too
+            log_write(_("Job {} failed: {}").format(job, err), to=sys.stderr)
+            queue.fail(job, name, str(err), permanent=True)
+        except Exception as err:
+            log_write(_("Job {} failed: {}").format(job, err), to=sys.stderr)
+            queue.fail(job, name, str(err))
+        else:
+            queue.finish(job, name, paths)
+            log_write(_("Job {} is done").format(job))
+        finally:
+            stop.set()
+            heart.join()
+    queue.close()
+
+
+def jobs(args):
+    """
+    Showing crawl jobs.
+    :param args: parsed command-line arguments (dict)
+    """
+    queue = open_queue(args)
+    for job in queue.jobs():
+        job_args = json.loads(job["args"])
+        print(job["id"], job["state"], job["attempts"], job["worker"], job_args.get("mode"), job_args.get("wall"),
+              job["error"] or job["result"] or "", sep="\t")
+    queue.close()
+
+
+def serve(args):
+    """
+    Running the HTTP service.
+    :param args: parsed command-line arguments (dict)
+    """
+    token = load_token()
+    if token is None:
+        print(_("Log in at first: no token.txt in the home directory"), file=sys.stderr)
+        sys.exit(1)
+    StatsRequestHandler.cache = ResultCache(token, ttl=args["ttl"], threads=args["crawlers"],
+                                            crawl_args={"posts": args["posts"]})
+    server = StatsHTTPServer((args["host"], args["port"]), StatsRequestHandler)
+    log_write(_("Serving on http://{}:{}/stats/<wall>").format(args["host"], args["port"]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+
+def merge(args):
+    """
+    Merging sketches of the approximate mode from several walls or shards.
+    :param args: parsed command-line arguments (dict)
+    """
+    sketch = None
+    for path in args["sketches"]:
+        with open(path, encoding="utf-8") as file:
+            part = AudienceSketch.from_dict(json.load(file)["sketch"])
+        if sketch is None:
+            sketch = part
+        else:
+            sketch.merge(part)
+    summary = sketch.summary()
+    output = os.path.abspath(args["output"])
+    write_atomic(output, lambda file: json.dump({"summary": summary, "sketch": sketch.to_dict()}, file))
+    log_write(_("About {} users (error {:.1%}), counts are higher by {} at most").format(
+        summary["distinct"]["estimate"], summary["distinct"]["relative_error"], summary["max_error"]))
+    for row in summary["top"][:args["top"]]:
+        print("https://vk.com/id{id}: {count} [{low}..{high}]".format(**row))
+    log_write(_("Exported to: {}").format(output))
+
+
+COMMANDS = {"query": (parse_query_args, query),
+            "timeline": (parse_timeline_args, timeline),
+            "overlap": (parse_overlap_args, overlap),
+            "likes": (parse_likes_args, likes),
+            "rings": (parse_rings_args, rings),
+            "submit": (parse_submit_args, submit),
+            "worker": (parse_worker_args, worker),
+            "jobs": (parse_jobs_args, jobs),
+            "serve": (parse_serve_args, serve),
+            "merge": (parse_merge_args, merge)}
+
+
+if __name__ == "__main__":
+    try:
+        load_plugins()
+        if len(sys.argv) > 1 and sys.argv[1] in COMMANDS:
+            parse_args, command = COMMANDS[sys.argv[1]]
+            command(parse_args(sys.argv[2:]))
+        else:
+            main(parse_cmd_args())
+    except (VKError, ValueError) as err:  # errors of VK, wrong dates and unknown walls
+        log_write(err, to=sys.stderr)
+        sys.exit(1)
@@ -19,25 +19,20 @@
 Computing rating of activity in VKontakte groups.
 """
 
-import sys
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 os.devnull = open(os.devnull, mode="w")
 
 import stats
-import gettext
-import locale
 
-from gi.repository import Gtk
+from gi.repository import Gtk, GLib
 
 from libs.vk_api_auth.vk_auth import auth
-from libs.gettext_windows import gettext_windows
 
-lang = gettext_windows.get_language()
-locale.setlocale(locale.LC_ALL, "")
-if not sys.platform.startswith("win"):
-    locale.bindtextdomain("vk_stats", "{}/locale".format(stats.SCRIPTDIR))
-translation = gettext.translation("vk_stats", localedir="{}/locale".format(stats.SCRIPTDIR), languages=lang)
-_ = translation.gettext
+stats.init_locale()  # the builder needs bound text domain for translating the interface
+_ = stats._
+MODE_TITLES = {"posts": _("Posts"), "liked": _("Likes"), "likers": _("Likers")}  # other modes show their names
 
 
 def error(primary=_("Error"), secondary=_("Unknown error")):
@@ -51,6 +46,134 @@ def error(primary=_("Error"), secondary=_("Unknown error")):
     error_win.show_all()
 
 
+def load_account(token, user_id):
+    """
+    Getting information about the account in the background, so the window is shown without waiting for VK.
+    :param token: access_token
+    :param user_id: ID of the logged user
+    """
+    def set_user_data(data):
+        global user_data
+        user_data = data
+
+    def worker():
+        try:
+            data = stats.call_api("users.get", params={"user_ids": user_id}, token=token)[0]
+            GLib.idle_add(set_user_data, data)
+            stats.call_api("stats.trackVisitor", params={}, token=token)  # needed for tracking you
+        except stats.VKError as err:
+            GLib.idle_add(error, "VK API {}".format(err.code), err.message)
+
+    thread = threading.Thread(target=worker, daemon=True)
+    thread.start()
+    return thread
+
+
+class ResultsView:
+    """
+    Rating in the Results window. Only the shown page is read from the exported sqlite file, so big ratings are
+    opened at once. Queries run in the background, results of outdated queries are dropped.
+    """
+    page_size = 200
+    columns = ("rank", "name", "screen_name", "id", "count")  # orders for the columns of ResultsTree
+
+    def __init__(self):
+        self.pages = None
+        self.offset = 0
+        self.order = "rank"
+        self.descending = False
+        self.search = ""
+        self.query = 0
+        self.worker = ThreadPoolExecutor(max_workers=1)  # the connection is used by its thread only
+
+    def open(self, path):
+        """
+        Showing a rating.
+        :param path: rating exported to the sqlite format
+        """
+        def reopen(old=self.pages):
+            if old is not None:
+                old.close()
+            return stats.RatingPages(path)
+
+        self.pages = self.worker.submit(reopen).result()
+        self.offset = 0
+        self.order = "rank"
+        self.descending = False
+        self.search = ""
+        self.load()
+
+    def load(self):
+        """
+        Reading the current page in the background.
+        """
+        self.query += 1
+        query, pages = self.query, self.pages
+        offset, order, descending, search = self.offset, self.order, self.descending, self.search
+
+        def worker():
+            try:
+                rows = pages.page(offset, self.page_size, order=order, descending=descending, search=search)
+                GLib.idle_add(self.show, query, rows, pages.total(search))
+            except stats.sqlite3.Error as err:
+                GLib.idle_add(error, _("Error"), str(err))
+
+        self.worker.submit(worker)
+
+    def show(self, query, rows, total):
+        """
+        Filling the table with a page.
+        :param query: number of the query
+        :param rows: rows of the page
+        :param total: number of found rows
+        """
+        if query != self.query:  # the page was changed while reading
+            return False
+        results_store.clear()
+        for rank, user_id, screen_name, first_name, last_name, count in rows:
+            results_store.append([rank, "{} {}".format(first_name, last_name), screen_name, user_id, count])
+        if total:
+            page_label.set_text(_("{}–{} of {}").format(self.offset + 1, self.offset + len(rows), total))
+        else:
+            page_label.set_text(_("Nothing found"))
+        results_prev.set_sensitive(self.offset > 0)
+        results_next.set_sensitive(self.offset + self.page_size < total)
+        return False
+
+    def scroll(self, pages):
+        """
+        Changing the page.
+        :param pages: number of pages, negative for previous pages
+        """
+        self.offset = max(0, self.offset + pages * self.page_size)
+        self.load()
+
+    def find(self, search):
+        """
+        Searching users.
+        :param search: part of a name or screen name, or ID
+        """
+        self.search = search
+        self.offset = 0
+        self.load()
+
+    def sort(self, column):
+        """
+        Sorting by a column, the second click reverses the order.
+        :param column: clicked GtkTreeViewColumn
+        """
+        columns = results_tree.get_columns()
+        order = self.columns[columns.index(column)]
+        self.descending = order == self.order and not self.descending
+        self.order = order
+        self.offset = 0
+        for other in columns:
+            other.set_sort_indicator(other is column)
+        # the count column is ordered by places, so the arrow shows the order of places
+        column.set_sort_order(Gtk.SortType.DESCENDING if self.descending else Gtk.SortType.ASCENDING)
+        self.load()
+
+
 class Handler:
     """
     Handler for GUI
@@ -117,6 +240,50 @@ class Handler:
         print(args, file=os.devnull)
         success_win.hide()
 
+    @staticmethod
+    def results_destroy(*args):
+        """
+        Closing the Results window.
+        :param args: used by GTK+
+        """
+        print(args, file=os.devnull)
+        results_win.hide()
+        return True
+
+    @staticmethod
+    def results_search(entry):
+        """
+        Searching in the Results window.
+        :param entry: ResultsSearch
+        """
+        results_view.find(entry.get_text().strip())
+
+    @staticmethod
+    def results_sort(column):
+        """
+        Sorting the Results window.
+        :param column: clicked column
+        """
+        results_view.sort(column)
+
+    @staticmethod
+    def results_prev(*args):
+        """
+        Showing the previous page of results.
+        :param args: used by GTK+
+        """
+        print(args, file=os.devnull)
+        results_view.scroll(-1)
+
+    @staticmethod
+    def results_next(*args):
+        """
+        Showing the next page of results.
+        :param args: used by GTK+
+        """
+        print(args, file=os.devnull)
+        results_view.scroll(1)
+
     @staticmethod
     def start(field):
         """
@@ -125,7 +292,7 @@ class Handler:
         """
         data = field.get_children()
         group = data[6].get_text().lower()
-        mode = data[4].get_active_text().lower()
+        mode = data[4].get_active_id()
         posts = data[1].get_text()
         date = data[0].get_text()
         if not group:
@@ -137,13 +304,19 @@ class Handler:
                 posts = 0
             else:
                 posts = int(posts)
-            if mode == _("posts"):
-                method = stats.Stats(group, token=access_token, posts_lim=posts, date_lim=date)
-            elif mode == _("likes"):
-                method = stats.LikedStats(group, token=access_token, posts_lim=posts, date_lim=date)
-            else:
-                method = stats.LikersStats(group, token=access_token, posts_lim=posts, date_lim=date, wall_filter="all")
-            method.stats()
+            try:
+                stats_mode = stats.MODES[mode]()
+                method = stats.Stats(group, token=access_token, posts_lim=posts, date_lim=date,
+                                     wall_filter=stats_mode.wall_filter)
+                paths = method.stats_modes([stats_mode], exports=stats.DEFAULT_EXPORTS + ("sqlite",))
+                results_search.set_text("")
+                results_view.open(next(path for path in paths if path.endswith(".sqlite")))
+                results_win.set_title("{} — {}".format(data[4].get_active_text(), method.screen_name))
+                results_win.show_all()
+            except stats.VKError as err:
+                error(primary="VK API {}".format(err.code), secondary=err.message)
+            except ValueError as err:  # wrong date or unknown group
+                error(secondary=str(err))
 
     @staticmethod
     def account_menu(*args):
@@ -153,7 +326,10 @@ class Handler:
         """
         print(args, file=os.devnull)
         label = logged_win.get_child().get_children()[0]
-        label.set_text(logged_text.format("{first_name} {last_name}".format(**user_data)))
+        if user_data is None:  # still loading
+            label.set_text(logged_text.format(user))
+        else:
+            label.set_text(logged_text.format("{first_name} {last_name}".format(**user_data)))
         logged_win.show_all()
 
     def authorization(self, field):
@@ -172,8 +348,8 @@ class Handler:
         token_file.close()
 
         access_token, user = auth_data
-        user_data = stats.call_api("users.get", params={"user_ids": user}, token=access_token)[0]
-        stats.call_api("stats.trackVisitor", params={}, token=access_token)  # needed for tracking you
+        user_data = None
+        load_account(access_token, user)
 
         login_win.hide()
         if not main.is_visible():
@@ -247,15 +423,29 @@ error_win = builder.get_object("Error")
 
 success_win = builder.get_object("Successfully")
 
+results_win = builder.get_object("Results")
+results_tree = builder.get_object("ResultsTree")
+results_store = builder.get_object("ResultsStore")
+results_search = builder.get_object("ResultsSearch")
+results_prev = builder.get_object("ResultsPrev")
+results_next = builder.get_object("ResultsNext")
+page_label = builder.get_object("ResultsPage")
+results_view = ResultsView()
+
 main = builder.get_object("StatsMain")
+stats.load_plugins()
+mode_select = builder.get_object("ModeSelect")
+for mode_name in stats.MODES:  # modes from the registry, plugins included
+    mode_select.append(mode_name, MODE_TITLES.get(mode_name, mode_name.capitalize()))
+mode_select.set_active(0)
 main.show_all()
 
 stats.no_console(error, success_win)
 
+user_data = None
 if "token.txt" in os.listdir(stats.HOME):
     access_token, user = open("{}/token.txt".format(stats.HOME)).read().split(",")
-    user_data = stats.call_api("users.get", params={"user_ids": user}, token=access_token)[0]
-    stats.call_api("stats.trackVisitor", params={}, token=access_token)  # needed for tracking you
+    load_account(access_token, user)
 else:
     main.hide()
     login_win.show_all()